@@ -0,0 +1,298 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from typing import List, Dict, Any
+
+from library_core import JSONStorage, JournalStorage, LibraryManager, SQLiteLibraryManager
+
+# Benchmarks LibraryManager operations on synthetic catalogs.
+#
+#   python benchmark.py                                  # 1k/10k/100k/1M, all backends
+#   python benchmark.py --sizes 1000,10000 --backends journal,sqlite
+#   python benchmark.py --save-baseline baseline.json
+#   python benchmark.py --compare baseline.json          # exit 1 on regressions
+#   python benchmark.py --check-imports                  # import-time budgets only
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+BACKENDS = {
+    'journal': lambda directory: LibraryManager(JournalStorage(os.path.join(directory, 'library.json'))),
+    'lazy': lambda directory: LibraryManager(JournalStorage(os.path.join(directory, 'library.json')), lazy=True),
+    'json': lambda directory: LibraryManager(JSONStorage(os.path.join(directory, 'library.json'))),
+    'sqlite': lambda directory: SQLiteLibraryManager(os.path.join(directory, 'library.db')),
+}
+
+# Import time in a fresh interpreter, and modules each import must not pull
+# in. The core and the CLI stay free of the UI stack; the app loads pandas and
+# plotly only on the pages that need them.
+IMPORT_BUDGETS = {
+    'library_core': (150, ('streamlit', 'pandas', 'plotly', 'numpy')),
+    'library_cli': (150, ('streamlit', 'pandas', 'plotly', 'numpy')),
+    'library_app': (1500, ('pandas', 'numpy')),
+}
+
+OPERATIONS = ['load_library', 'save_library', 'add_book', 'remove_book', 'search_books', 'get_statistics']
+
+ADJECTIVES = ["Silent", "Hidden", "Last", "Broken", "Golden", "Dark", "Lost", "Secret", "Burning",
+              "Frozen", "Crimson", "Endless", "Forgotten", "Little", "Wild", "Distant", "Shattered"]
+NOUNS = ["Kingdom", "River", "Garden", "Empire", "Heart", "Shadow", "Storm", "City", "Sea", "Crown",
+         "Mountain", "Library", "Dream", "War", "Road", "House", "Star", "Winter", "Night", "Forest"]
+PLACES = ["Avalon", "the North", "Babylon", "the Valley", "Mars", "Paris", "the Deep", "Eden", "Tokyo"]
+FIRST_NAMES = ["James", "Mary", "John", "Ursula", "Neil", "Agatha", "Isaac", "Jane", "George", "Toni",
+               "Haruki", "Chimamanda", "Leo", "Virginia", "Gabriel", "Octavia", "Terry", "Margaret"]
+LAST_NAMES = ["Smith", "Le Guin", "Gaiman", "Christie", "Asimov", "Austen", "Orwell", "Morrison",
+              "Murakami", "Adichie", "Tolstoy", "Woolf", "Marquez", "Butler", "Pratchett", "Atwood"]
+GENRES = ["Fiction", "Non-Fiction", "Science Fiction", "Fantasy", "Mystery", "Thriller",
+          "Romance", "Biography", "History", "Self-Help", "Other"]
+GENRE_WEIGHTS = [22, 12, 10, 11, 10, 8, 12, 4, 5, 3, 3]
+
+
+def _zipf_cum_weights(n: int, s: float = 1.1) -> List[float]:
+    # Cumulative Zipf weights, so a few authors write most of the books
+    total = 0.0
+    cum = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** s
+        cum.append(total)
+    return cum
+
+
+def _title(rng: random.Random) -> str:
+    pattern = rng.random()
+    if pattern < 0.4:
+        return f"The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"
+    if pattern < 0.7:
+        return f"{rng.choice(NOUNS)} of {rng.choice(PLACES)}"
+    if pattern < 0.9:
+        return f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {rng.randint(1, 9)}"
+    return f"A {rng.choice(NOUNS)} for {rng.choice(FIRST_NAMES)}"
+
+
+def generate_catalog(size: int, seed: int = 42) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    authors = list({f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}"
+                    for i in range(max(10, size // 8))})
+    book_authors = rng.choices(authors, cum_weights=_zipf_cum_weights(len(authors)), k=size)
+    genres = rng.choices(GENRES, weights=GENRE_WEIGHTS, k=size)
+    start = date(2020, 1, 1)
+    catalog = []
+    for i in range(size):
+        catalog.append({
+            'title': _title(rng),
+            'author': book_authors[i],
+            # Skewed towards recent publications
+            'year': int(rng.triangular(1800, 2024, 2015)),
+            'genre': genres[i],
+            'read': rng.random() < 0.4,
+            'rating': rng.choices([0, 1, 2, 3, 4, 5], weights=[30, 3, 7, 20, 25, 15])[0],
+            'date_added': (start + timedelta(days=rng.randrange(5 * 365))).isoformat()
+        })
+    return catalog
+
+
+def _queries(catalog: List[Dict[str, Any]], rng: random.Random, count: int) -> List[str]:
+    # Substrings of real titles and authors, a few short prefixes and misses
+    queries = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.1:
+            queries.append("zzqx")
+        else:
+            book = rng.choice(catalog)
+            text = book['title'] if kind < 0.6 else book['author']
+            length = rng.choice([2, 4, 6, 10])
+            start = rng.randrange(max(1, len(text) - length))
+            queries.append(text[start:start + length])
+    return queries
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def _measure(run, ops: int, max_seconds: float, min_ops: int = 5) -> Dict[str, Any]:
+    # Times run(i) until `ops` calls or the time budget is spent, then repeats
+    # a few calls under tracemalloc for the peak allocation
+    samples = []
+    started = time.perf_counter()
+    for i in range(ops):
+        t0 = time.perf_counter()
+        run(i)
+        samples.append(time.perf_counter() - t0)
+        if len(samples) >= min_ops and time.perf_counter() - started > max_seconds:
+            break
+    elapsed = sum(samples)
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for i in range(min(3, len(samples))):
+        run(len(samples) + i)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    return {
+        'ops': len(samples),
+        'p50_ms': _percentile(samples, 50) * 1000,
+        'p95_ms': _percentile(samples, 95) * 1000,
+        'p99_ms': _percentile(samples, 99) * 1000,
+        'throughput': len(samples) / elapsed if elapsed else float('inf'),
+        'peak_mb': peak / 2 ** 20
+    }
+
+
+def bench_backend(backend: str, catalog: List[Dict[str, Any]], ops: int, max_seconds: float,
+                  seed: int) -> Dict[str, Dict[str, Any]]:
+    rng = random.Random(seed)
+    directory = tempfile.mkdtemp(prefix='library-bench-')
+    manager = None
+    try:
+        manager = BACKENDS[backend](directory)
+        manager.add_books(catalog)
+        results = {}
+
+        results['load_library'] = _measure(lambda i: BACKENDS[backend](directory), ops, max_seconds)
+        results['save_library'] = _measure(lambda i: manager.save_library(), ops, max_seconds)
+
+        new_books = generate_catalog(ops + 3, seed + 1)
+        results['add_book'] = _measure(lambda i: manager.add_book(**new_books[i % len(new_books)]),
+                                       ops, max_seconds)
+
+        titles = [book['title'] for book in rng.sample(catalog, min(len(catalog), ops + 3))]
+        results['remove_book'] = _measure(lambda i: manager.remove_book(titles[i % len(titles)]),
+                                          ops, max_seconds)
+
+        queries = _queries(catalog, rng, ops + 3)
+        results['search_books'] = _measure(lambda i: manager.search_books(queries[i % len(queries)]),
+                                           ops, max_seconds)
+        results['get_statistics'] = _measure(lambda i: manager.get_statistics(), ops, max_seconds)
+        return results
+    finally:
+        if isinstance(manager, SQLiteLibraryManager):
+            manager.conn.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def measure_import(module: str, runs: int = 5) -> Dict[str, Any]:
+    # Median over fresh interpreters, so nothing is already cached in sys.modules
+    code = (f"import sys, time; started = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - started); print(','.join(sorted(sys.modules)))")
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        seconds, modules = result.stdout.strip().split('\n')[-2:]
+        samples.append(float(seconds))
+    return {'median_ms': statistics.median(samples) * 1000, 'modules': set(modules.split(','))}
+
+
+def check_imports(runs: int = 5) -> List[str]:
+    failures = []
+    print(f"\n{'module':<16}{'median ms':>11}{'budget ms':>11}")
+    for module, (budget_ms, forbidden) in IMPORT_BUDGETS.items():
+        measured = measure_import(module, runs)
+        print(f"{module:<16}{measured['median_ms']:>11.1f}{budget_ms:>11}")
+        if measured['median_ms'] > budget_ms:
+            failures.append(f"{module}: import took {measured['median_ms']:.1f}ms, budget {budget_ms}ms")
+        loaded = [name for name in forbidden if name in measured['modules']]
+        if loaded:
+            failures.append(f"{module}: importing it loads {', '.join(loaded)}")
+    return failures
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+            min_ms: float = 0.05) -> List[str]:
+    # A regression is a p50 more than `threshold` times the baseline's;
+    # operations faster than min_ms are too noisy to judge
+    regressions = []
+    for backend, sizes in results.items():
+        for size, operations in sizes.items():
+            for operation, current in operations.items():
+                previous = baseline.get(backend, {}).get(size, {}).get(operation)
+                if previous is None or not previous['p50_ms'] or current['p50_ms'] < min_ms:
+                    continue
+                ratio = current['p50_ms'] / previous['p50_ms']
+                if ratio > threshold:
+                    regressions.append(f"{backend} {size} {operation}: p50 {previous['p50_ms']:.3f}ms -> "
+                                       f"{current['p50_ms']:.3f}ms ({ratio:.2f}x)")
+    return regressions
+
+
+def print_table(backend: str, size: int, results: Dict[str, Dict[str, Any]]) -> None:
+    print(f"\n{backend} — {size:,} books")
+    print(f"{'operation':<16}{'ops':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'ops/s':>12}{'peak MB':>10}")
+    for operation in OPERATIONS:
+        r = results[operation]
+        print(f"{operation:<16}{r['ops']:>7}{r['p50_ms']:>11.3f}{r['p95_ms']:>11.3f}{r['p99_ms']:>11.3f}"
+              f"{r['throughput']:>12.1f}{r['peak_mb']:>10.2f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark LibraryManager operations at scale")
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help="comma-separated catalog sizes")
+    parser.add_argument('--backends', default=','.join(BACKENDS), help="comma-separated backends")
+    parser.add_argument('--ops', type=int, default=200, help="calls per operation")
+    parser.add_argument('--max-seconds', type=float, default=10.0,
+                        help="time budget per operation (at least 5 calls always run)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="write results as JSON")
+    parser.add_argument('--save-baseline', help="write results as the new baseline")
+    parser.add_argument('--compare', help="baseline JSON to check for regressions")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="p50 slowdown factor that counts as a regression")
+    parser.add_argument('--min-ms', type=float, default=0.05,
+                        help="ignore operations whose p50 is below this when comparing")
+    parser.add_argument('--check-imports', action='store_true',
+                        help="only check import times against IMPORT_BUDGETS (exit 1 if over)")
+    args = parser.parse_args(argv)
+
+    if args.check_imports:
+        failures = check_imports()
+        for line in failures:
+            print("  " + line)
+        return 1 if failures else 0
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    backends = args.backends.split(',')
+    for backend in backends:
+        if backend not in BACKENDS:
+            parser.error(f"unknown backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+    # JSON keys are strings, so sizes are stored as strings too
+    results = {backend: {} for backend in backends}
+    for size in sizes:
+        catalog = generate_catalog(size, args.seed)
+        for backend in backends:
+            results[backend][str(size)] = bench_backend(backend, catalog, args.ops, args.max_seconds, args.seed)
+            print_table(backend, size, results[backend][str(size)])
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_ms)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print("\nNo regressions against", args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,225 +1,394 @@
-import json
-import streamlit as st
-from typing import List, Dict, Any
-import pandas as pd
+import importlib.util
+import io
+import os
+import re
 from datetime import datetime
-import plotly.express as px
-import plotly.graph_objects as go
-import random
-
-# Set page configuration
-st.set_page_config(
-    page_title="Modern Library Manager",
-    page_icon="📚",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
-
-# Apply custom CSS
-st.markdown("""
-<style>
-    .main-header {
-        font-size: 2.5rem;
-        color: #1E88E5;
-        text-align: center;
-        margin-bottom: 1rem;
-    }
-    .subheader {
-        font-size: 1.8rem;
-        color: #0D47A1;
-        margin-bottom: 1rem;
-    }
-    .card {
-        border-radius: 15px;
-        padding: 1.8rem;
-        background: linear-gradient(145deg, #ffffff, #f5f7fa);
-        box-shadow: 5px 5px 15px #d1d9e6, -5px -5px 15px #ffffff;
-        margin-bottom: 1.5rem;
-        transition: transform 0.2s ease;
-    }
-    .card:hover {
-        transform: translateY(-5px);
-    }
-    
-    /* Enhanced Book Card */
-    .book-card {
-        border-left: 5px solid #1E88E5;
-        padding: 1.2rem;
-        background: white;
-        border-radius: 10px;
-        box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1);
-        margin-bottom: 1rem;
-        transition: all 0.3s ease;
-    }
-    .book-card:hover {
-        transform: translateX(5px);
-        box-shadow: 0 6px 20px rgba(0, 0, 0, 0.15);
-    }
+from typing import Any, Dict
+
+import streamlit as st
+
+from library_core import (BOOK_FIELDS, EXPORT_FORMATS, LibraryManager, LibraryPool, create_library_manager,
+                          import_catalog, metrics, timed)
+
+# pandas and plotly take most of the import time and only the Table View and
+# the Statistics page need them, so they are imported where they are used
+
+
+def configure_page() -> None:
+    # Set page configuration
+    st.set_page_config(
+        page_title="Modern Library Manager",
+        page_icon="📚",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+
+    # Apply custom CSS
+    st.markdown("""
+    <style>
+        .main-header {
+            font-size: 2.5rem;
+            color: #1E88E5;
+            text-align: center;
+            margin-bottom: 1rem;
+        }
+        .subheader {
+            font-size: 1.8rem;
+            color: #0D47A1;
+            margin-bottom: 1rem;
+        }
+        .card {
+            border-radius: 15px;
+            padding: 1.8rem;
+            background: linear-gradient(145deg, #ffffff, #f5f7fa);
+            box-shadow: 5px 5px 15px #d1d9e6, -5px -5px 15px #ffffff;
+            margin-bottom: 1.5rem;
+            transition: transform 0.2s ease;
+        }
+        .card:hover {
+            transform: translateY(-5px);
+        }
     
-    /* Enhanced Badges */
-    .read-badge {
-        background: linear-gradient(45deg, #4CAF50, #45a049);
-        color: white;
-        padding: 0.3rem 0.8rem;
-        border-radius: 20px;
-        font-size: 0.9rem;
-        font-weight: 500;
-        text-shadow: 1px 1px 2px rgba(0,0,0,0.2);
-    }
-    .unread-badge {
-        background: linear-gradient(45deg, #FFC107, #FFB300);
-        color: #212121;
-        padding: 0.3rem 0.8rem;
-        border-radius: 20px;
-        font-size: 0.9rem;
-        font-weight: 500;
-    }
+        /* Enhanced Book Card */
+        .book-card {
+            border-left: 5px solid #1E88E5;
+            padding: 1.2rem;
+            background: white;
+            border-radius: 10px;
+            box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1);
+            margin-bottom: 1rem;
+            transition: all 0.3s ease;
+        }
+        .book-card:hover {
+            transform: translateX(5px);
+            box-shadow: 0 6px 20px rgba(0, 0, 0, 0.15);
+        }
     
-    /* Enhanced Form Controls */
-    .stTextInput > div > div {
-        border-radius: 8px;
-        border: 2px solid #e0e0e0;
-        padding: 0.5rem;
-    }
-    .stTextInput > div > div:focus-within {
-        border-color: #1E88E5;
-        box-shadow: 0 0 0 2px rgba(30,136,229,0.2);
-    }
+        /* Enhanced Badges */
+        .read-badge {
+            background: linear-gradient(45deg, #4CAF50, #45a049);
+            color: white;
+            padding: 0.3rem 0.8rem;
+            border-radius: 20px;
+            font-size: 0.9rem;
+            font-weight: 500;
+            text-shadow: 1px 1px 2px rgba(0,0,0,0.2);
+        }
+        .unread-badge {
+            background: linear-gradient(45deg, #FFC107, #FFB300);
+            color: #212121;
+            padding: 0.3rem 0.8rem;
+            border-radius: 20px;
+            font-size: 0.9rem;
+            font-weight: 500;
+        }
     
-    /* Enhanced Buttons */
-    .stButton>button {
-        width: 100%;
-        border-radius: 8px;
-        background: linear-gradient(45deg, #1E88E5, #1976D2);
-        color: white;
-        font-weight: 500;
-        padding: 0.6rem 1.2rem;
-        border: none;
-        box-shadow: 0 4px 15px rgba(30,136,229,0.3);
-        transition: all 0.3s ease;
-    }
-    .stButton>button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 6px 20px rgba(30,136,229,0.4);
-    }
+        /* Enhanced Form Controls */
+        .stTextInput > div > div {
+            border-radius: 8px;
+            border: 2px solid #e0e0e0;
+            padding: 0.5rem;
+        }
+        .stTextInput > div > div:focus-within {
+            border-color: #1E88E5;
+            box-shadow: 0 0 0 2px rgba(30,136,229,0.2);
+        }
     
-    /* Enhanced Metrics */
-    .metric-card {
-        background: linear-gradient(145deg, #ffffff, #f5f7fa);
-        border-radius: 15px;
-        padding: 1.5rem;
-        text-align: center;
-        box-shadow: 5px 5px 15px #d1d9e6;
-    }
-    .metric-value {
-        font-size: 2.5rem;
-        font-weight: bold;
-        color: #1E88E5;
-    }
-    .metric-label {
-        font-size: 1.1rem;
-        color: #424242;
-        margin-top: 0.5rem;
-    }
+        /* Enhanced Buttons */
+        .stButton>button {
+            width: 100%;
+            border-radius: 8px;
+            background: linear-gradient(45deg, #1E88E5, #1976D2);
+            color: white;
+            font-weight: 500;
+            padding: 0.6rem 1.2rem;
+            border: none;
+            box-shadow: 0 4px 15px rgba(30,136,229,0.3);
+            transition: all 0.3s ease;
+        }
+        .stButton>button:hover {
+            transform: translateY(-2px);
+            box-shadow: 0 6px 20px rgba(30,136,229,0.4);
+        }
     
-    /* Enhanced Charts */
-    .chart-container {
-        background: white;
-        border-radius: 15px;
-        padding: 1.5rem;
-        box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1);
-    }
-</style>
-""", unsafe_allow_html=True)
-
-class LibraryManager:
-    def __init__(self):
-        self.books = []
-        self.load_library()
-
-    def add_book(self, title: str, author: str, year: int, genre: str, read: bool, rating: int = 0, date_added: str = None) -> None:
-        if not date_added:
-            date_added = datetime.now().strftime("%Y-%m-%d")
-            
-        book = {
-            'title': title,
-            'author': author,
-            'year': year,
-            'genre': genre,
-            'read': read,
-            'rating': rating,
-            'date_added': date_added
+        /* Enhanced Metrics */
+        .metric-card {
+            background: linear-gradient(145deg, #ffffff, #f5f7fa);
+            border-radius: 15px;
+            padding: 1.5rem;
+            text-align: center;
+            box-shadow: 5px 5px 15px #d1d9e6;
         }
-        self.books.append(book)
-        self.save_library()
-
-    def remove_book(self, title: str) -> bool:
-        for book in self.books:
-            if book['title'].lower() == title.lower():
-                self.books.remove(book)
-                self.save_library()
-                return True
-        return False
-
-    def search_books(self, query: str) -> List[Dict[str, Any]]:
-        query = query.lower()
-        return [book for book in self.books if 
-                query in book['title'].lower() or 
-                query in book['author'].lower()]
-
-    def get_all_books(self) -> List[Dict[str, Any]]:
-        return self.books
-
-    def get_statistics(self) -> Dict[str, Any]:
-        total_books = len(self.books)
-        read_books = sum(1 for book in self.books if book['read'])
-        percent_read = (read_books / total_books * 100) if total_books > 0 else 0
-        
-        # Get genre distribution
-        genres = {}
-        for book in self.books:
-            genre = book['genre']
-            if genre in genres:
-                genres[genre] += 1
-            else:
-                genres[genre] = 1
-                
-        # Get author distribution (top 5)
-        authors = {}
-        for book in self.books:
-            author = book['author']
-            if author in authors:
-                authors[author] += 1
-            else:
-                authors[author] = 1
-        top_authors = dict(sorted(authors.items(), key=lambda x: x[1], reverse=True)[:5])
-        
-        return {
-            'total_books': total_books,
-            'read_books': read_books,
-            'percent_read': round(percent_read, 2),
-            'genres': genres,
-            'top_authors': top_authors
+        .metric-value {
+            font-size: 2.5rem;
+            font-weight: bold;
+            color: #1E88E5;
+        }
+        .metric-label {
+            font-size: 1.1rem;
+            color: #424242;
+            margin-top: 0.5rem;
+        }
+    
+        /* Enhanced Charts */
+        .chart-container {
+            background: white;
+            border-radius: 15px;
+            padding: 1.5rem;
+            box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1);
         }
+    </style>
+    """, unsafe_allow_html=True)
+
+def book_card_html(book: Dict[str, Any]) -> str:
+    return f"""
+    <div class="book-card">
+        <div class="book-title">{book['title']}</div>
+        <div class="book-author">by {book['author']}</div>
+        <div class="book-meta">{book['genre']} • {book['year']}</div>
+        <div style="margin-top: 10px;">
+            <span class="{'read-badge' if book['read'] else 'unread-badge'}">{
+                "Read ✓" if book['read'] else "Not Read"}</span>
+            <span style="margin-left: 10px;">{"⭐" * book.get('rating', 0)}</span>
+        </div>
+    </div>
+    """
+
+
+PAGE_SIZES = [12, 24, 48, 96]
+
+SORT_OPTIONS = {
+    "Library Order": None,
+    "Title": 'title',
+    "Author": 'author',
+    "Year": 'year',
+    "Genre": 'genre',
+    "Rating": 'rating',
+    "Date Added": 'date_added'
+}
+
+
+# Books offered at a time on the Remove page
+REMOVE_CHOICES = 50
+
+
+def page_caption(page: Dict[str, Any]) -> str:
+    return f"Page {page['page']} of {page['pages']} • {page['total']} books"
+
+
+READ_FILTERS = {"All": None, "Read": True, "Unread": False}
+
+
+def library_filters() -> Dict[str, Any]:
+    # The sidebar widgets are drawn after the query (so they can show facet
+    # counts), so the query reads their values from the previous run
+    state = st.session_state
+    filters = {'genres': state.get('filter_genres') or None,
+               'read': READ_FILTERS[state.get('filter_read', "All")],
+               'min_rating': state.get('filter_rating', 0),
+               'text': state.get('filter_text') or None}
+    # A slider left at the library's full range is no filter at all, which
+    # also keeps the books without a year
+    years = state.get('filter_years')
+    if years and tuple(years) != state.get('filter_year_range'):
+        filters['year_min'], filters['year_max'] = years
+    added = state.get('filter_added') or ()
+    if len(added) == 2:
+        filters['added_from'], filters['added_to'] = added
+    return filters
+
+
+def render_library_filters(page: Dict[str, Any]) -> None:
+    facets = page['facets']
+    state = st.session_state
+    with st.sidebar:
+        st.markdown("### Filters")
+        genres = list(facets['genre']) + [g for g in state.get('filter_genres', []) if g not in facets['genre']]
+        st.multiselect("Genre", sorted(genres), key='filter_genres',
+                       format_func=lambda g: f"{g} ({facets['genre'].get(g, 0)})")
+        low, high = page['year_range']
+        if low is not None and low < high:
+            # A slider at the ends follows the range as the library changes
+            current = state.get('filter_years')
+            if current and (tuple(current) == state.get('filter_year_range')
+                            or not (low <= current[0] <= current[1] <= high)):
+                del state['filter_years']
+            state['filter_year_range'] = (low, high)
+            st.slider("Year", low, high, (low, high), key='filter_years')
+        read_counts = {"All": sum(facets['read'].values()), "Read": facets['read'].get(True, 0),
+                       "Unread": facets['read'].get(False, 0)}
+        st.radio("Status", list(READ_FILTERS), key='filter_read', horizontal=True,
+                 format_func=lambda status: f"{status} ({read_counts[status]})")
+        st.select_slider("Minimum rating", options=list(range(6)), key='filter_rating',
+                         format_func=lambda r: "Any" if r == 0 else "⭐" * r)
+        st.date_input("Added between", value=(), key='filter_added')
+        st.text_input("Title or author contains", key='filter_text')
+
+
+def export_data(manager: LibraryManager, fmt: str, filters: Dict[str, Any], sort_by: str, descending: bool) -> bytes:
+    # Streamlit holds every download in memory as bytes, so the whole export
+    # is in memory at once whatever we do here; for files too big for that,
+    # use `library_cli.py export`, which streams to disk
+    f = io.BytesIO()
+    manager.export(f, fmt, filters, sort_by, descending)
+    return f.getvalue()
+
+
+def render_export_button(manager: LibraryManager, filters: Dict[str, Any], sort_by: str, descending: bool) -> None:
+    # The file is only written when the button is clicked
+    formats = [fmt for fmt in EXPORT_FORMATS if fmt != 'parquet' or importlib.util.find_spec('pyarrow')]
+    with st.sidebar:
+        st.markdown("### Export")
+        fmt = st.selectbox("Format", formats, format_func=str.upper, key='export_format')
+        st.download_button("⬇️ Download matching books",
+                           lambda: export_data(manager, fmt, filters, sort_by, descending),
+                           file_name=f"library.{fmt}", mime=EXPORT_FORMATS[fmt], on_click='ignore')
+
 
-    def save_library(self) -> None:
-        with open('library.json', 'w') as f:
-            json.dump(self.books, f)
+@timed('figure.reading_status')
+def reading_status_figure(stats: Dict[str, Any]):
+    import plotly.graph_objects as go
+
+    fig = go.Figure(data=[go.Pie(
+        labels=['Read', 'Unread'],
+        values=[stats['read_books'], stats['total_books'] - stats['read_books']],
+        hole=.6,
+        marker_colors=['#4CAF50', '#FFC107']
+    )])
+    fig.update_layout(
+        title_text="Reading Status",
+        showlegend=True,
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        title_x=0.5
+    )
+    return fig
+
+
+@timed('figure.genre')
+def genre_figure(stats: Dict[str, Any]):
+    import pandas as pd
+    import plotly.express as px
+
+    genres_df = pd.DataFrame({
+        'Genre': list(stats['genres'].keys()),
+        'Count': list(stats['genres'].values())
+    })
+    fig = px.bar(genres_df, x='Genre', y='Count', color='Count',
+                color_continuous_scale='Blues')
+    fig.update_layout(title_text="Books by Genre")
+    return fig
+
+
+@timed('figure.author')
+def author_figure(stats: Dict[str, Any]):
+    import pandas as pd
+    import plotly.express as px
+
+    authors_df = pd.DataFrame({
+        'Author': list(stats['top_authors'].keys()),
+        'Books': list(stats['top_authors'].values())
+    })
+    fig = px.bar(authors_df, x='Author', y='Books', color='Books',
+                color_continuous_scale='Greens')
+    fig.update_layout(title_text="Top Authors in Your Library")
+    return fig
+
+
+@timed('figure.timeline')
+def timeline_figure(growth: Dict[str, Any]):
+    # Takes get_growth_timeline() output; None when no book has a date
+    import plotly.express as px
+
+    if not growth['periods']:
+        return None
+    
+    # Plot the running total the manager already keeps
+    return px.line(x=growth['periods'], y=growth['total'], markers=len(growth['periods']) < 60,
+                   labels={'x': 'Date', 'y': 'Total Books'},
+                   title='Library Growth Over Time')
+
+
+GROWTH_RESOLUTIONS = {"Day": 'day', "Month": 'month', "Year": 'year'}
+
+
+METRICS_FORMATS = {"JSON": 'json', "Prometheus": 'prom'}
+
+
+def metrics_dump_path(extension: str) -> str:
+    # library_metrics.<extension> in LIBRARY_METRICS_DIR (default: the
+    # working directory)
+    directory = os.environ.get('LIBRARY_METRICS_DIR', '.')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"library_metrics.{extension}")
+
+
+def render_diagnostics_panel() -> None:
+    # Hidden unless the app is opened with ?diagnostics=1 or LIBRARY_METRICS=1
+    with st.sidebar.expander("🔧 Diagnostics"):
+        metrics.enabled = st.checkbox("Collect timings", value=metrics.enabled, key="diagnostics_enabled")
+        data = metrics.snapshot()
+        if data['histograms']:
+            rows = [{
+                'Operation': name,
+                'Calls': h['count'],
+                'Mean ms': round(h['sum'] / h['count'] * 1000, 3),
+                'p95 ms (≤)': metrics.quantile(name, 0.95) * 1000,
+                'Max ms': round(h['max'] * 1000, 3)
+            } for name, h in sorted(data['histograms'].items())]
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+        else:
+            st.caption("No timings recorded yet.")
+        if data['counters']:
+            st.json(data['counters'])
+        # Only the format comes from the browser; where the file goes is the
+        # server's choice, so the panel can't overwrite anything else
+        fmt = st.selectbox("Dump format", list(METRICS_FORMATS), key="diagnostics_format")
+        col_dump, col_reset = st.columns(2)
+        with col_dump:
+            if st.button("Dump"):
+                path = metrics_dump_path(METRICS_FORMATS[fmt])
+                metrics.dump(path)
+                st.success(f"Wrote {path}")
+        with col_reset:
+            if st.button("Reset"):
+                metrics.reset()
+
+
+@st.cache_resource
+def get_library_manager() -> LibraryManager:
+    # One manager per process, shared by every browser session
+    return create_library_manager()
+
+
+@st.cache_resource
+def get_library_pool() -> LibraryPool:
+    # Libraries opened with ?library=<id>, shared by every browser session;
+    # the pool closes the least recently used ones to stay within its budget
+    return LibraryPool()
 
-    def load_library(self) -> None:
-        try:
-            with open('library.json', 'r') as f:
-                self.books = json.load(f)
-        except FileNotFoundError:
-            self.books = []
 
 def main():
-    # Initialize session state for library manager
-    if 'library_manager' not in st.session_state:
-        st.session_state['library_manager'] = LibraryManager()
+    configure_page()
+    # Looked up on every rerun: the pool may have closed this session's
+    # library since the last one
+    library_id = st.query_params.get('library')
+    try:
+        st.session_state['library_manager'] = (get_library_manager() if library_id is None
+                                               else get_library_pool().get(library_id))
+    except ValueError as e:
+        st.error(str(e))
+        st.stop()
+    # Other workers or an import job may have changed the library files
+    st.session_state.library_manager.refresh()
+    writer = st.session_state.library_manager.writer
+    if writer is not None and writer.last_error is not None:
+        st.warning(f"Saving the library failed, will retry: {writer.last_error}")
 
     # Custom header with HTML
     st.markdown('<h1 class="main-header">📚 Modern Library Manager</h1>', unsafe_allow_html=True)
+    if library_id is not None:
+        st.caption(f"Library: {library_id}")
 
     # Remove this duplicate initialization block
     # if 'library_manager' not in st.session_state:
@@ -235,9 +404,12 @@ def main():
         
         menu = st.selectbox(
             "Choose an option",
-            ["📕 Add Book", "🗑️ Remove Book", "🔍 Search Books", "📚 My Library", "📊 Statistics & Analytics"]
+            ["📕 Add Book", "📥 Import Books", "🗑️ Remove Book", "🔍 Search Books", "📚 My Library", "📊 Statistics & Analytics"]
         )
 
+    # Each page is timed as "page.<name>" when metrics are on
+    page_started = metrics.start()
+
     if "📕 Add Book" in menu:
         st.markdown('<h2 class="subheader">Add a New Book</h2>', unsafe_allow_html=True)
         
@@ -289,17 +461,54 @@ def main():
                 st.info("Fill in the form to see a preview of your book entry")
             st.markdown('</div>', unsafe_allow_html=True)
 
+    elif "📥 Import Books" in menu:
+        st.markdown('<h2 class="subheader">Import Books</h2>', unsafe_allow_html=True)
+        st.markdown('<div class="card">', unsafe_allow_html=True)
+        
+        uploaded = st.file_uploader("Upload a CSV or JSONL catalog", type=["csv", "jsonl"])
+        st.caption("Columns: title, author, year, genre, read, rating, date_added")
+        
+        if uploaded is not None and st.button("Import Books"):
+            fmt = 'jsonl' if uploaded.name.lower().endswith('.jsonl') else 'csv'
+            progress = st.progress(0.0, text="Reading file...")
+            
+            def on_progress(rows):
+                done = min(uploaded.tell() / max(uploaded.size, 1), 1.0)
+                progress.progress(done, text=f"Checked {rows} rows")
+            
+            added, rejected = import_catalog(st.session_state.library_manager, uploaded, fmt,
+                                             on_progress=on_progress)
+            progress.progress(1.0, text="Done")
+            st.success(f"Imported {added} books")
+            if rejected:
+                st.warning(f"{len(rejected)} rows were rejected")
+                # Only the first rejections, a broken file can have thousands
+                st.dataframe([{'Row': row, 'Error': error} for row, error in rejected[:1000]],
+                             use_container_width=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
     elif "🗑️ Remove Book" in menu:
         st.markdown('<h2 class="subheader">Remove a Book</h2>', unsafe_allow_html=True)
         st.markdown('<div class="card">', unsafe_allow_html=True)
         
-        books = st.session_state.library_manager.get_all_books()
+        manager = st.session_state.library_manager
+        # Only one page of books is offered, the newest first, or the first
+        # matches of a search; the rest of the library is never fetched
+        query = st.text_input("Find a book by title or author", key="remove_query")
+        if query:
+            page = manager.search_page(query, ('title', 'author'), 1, REMOVE_CHOICES)
+        else:
+            page = manager.get_books_page(1, REMOVE_CHOICES, descending=True)
+        books = page['books']
         if books:
-            book_titles = [book['title'] for book in books]
-            title_to_remove = st.selectbox("Select a book to remove", book_titles)
-            
+            # Options are book ids, so books sharing a title stay distinct
+            labels = {book['id']: f"{book['title']} — {book['author']} ({book['year']})" for book in books}
+            book_id = st.selectbox("Select a book to remove", list(labels), format_func=labels.get)
+            if page['total'] > len(books):
+                st.caption(f"Showing {len(books)} of {page['total']} books; search to narrow the list")
+
             # Display the selected book details
-            selected_book = next((book for book in books if book['title'] == title_to_remove), None)
+            selected_book = manager.get_book(book_id)
             if selected_book:
                 st.markdown(f"""
                 <div class="book-card">
@@ -310,11 +519,13 @@ def main():
                 """, unsafe_allow_html=True)
             
             if st.button("Remove Selected Book"):
-                if st.session_state.library_manager.remove_book(title_to_remove):
-                    st.success(f"Removed: {title_to_remove}")
-                    st.experimental_rerun()
+                if manager.remove_book_by_id(book_id):
+                    st.success(f"Removed: {selected_book['title']}")
+                    st.rerun()
                 else:
                     st.error("Book not found!")
+        elif query:
+            st.info("No books found matching your search.")
         else:
             st.info("Your library is empty.")
         st.markdown('</div>', unsafe_allow_html=True)
@@ -334,31 +545,32 @@ def main():
             search_by_genre = st.checkbox("Genre", value=False)
             
         if query:
-            results = st.session_state.library_manager.search_books(query)
-            
-            # Filter based on checkboxes
-            filtered_results = []
-            for book in results:
-                if (search_by_title and query.lower() in book['title'].lower()) or \
-                   (search_by_author and query.lower() in book['author'].lower()) or \
-                   (search_by_genre and query.lower() in book['genre'].lower()):
-                    filtered_results.append(book)
+            fields = [field for field, checked in (('title', search_by_title),
+                                                    ('author', search_by_author),
+                                                    ('genre', search_by_genre)) if checked]
+            ranked = st.toggle("Rank by relevance (tolerates typos)", value=True)
+            if ranked:
+                limit = st.selectbox("Show top", [10, 20, 50, 100], index=1, key="search_limit")
+                books = st.session_state.library_manager.search_ranked(query, fields, limit)
+                summary = f"Top {len(books)} matches for '{query}'"
+            else:
+                col_size, col_page = st.columns(2)
+                with col_size:
+                    page_size = st.selectbox("Results per page", PAGE_SIZES, index=1, key="search_page_size")
+                with col_page:
+                    page_number = st.number_input("Page", min_value=1, value=1, step=1, key="search_page")
+                results = st.session_state.library_manager.search_page(query, fields, page_number, page_size)
+                books = results['books']
+                summary = f"Found {results['total']} books matching '{query}'"
             
-            if filtered_results:
-                st.write(f"Found {len(filtered_results)} books matching '{query}'")
-                for book in filtered_results:
-                    st.markdown(f"""
-                    <div class="book-card">
-                        <div class="book-title">{book['title']}</div>
-                        <div class="book-author">by {book['author']}</div>
-                        <div class="book-meta">{book['genre']} • {book['year']}</div>
-                        <div style="margin-top: 10px;">
-                            <span class="{'read-badge' if book['read'] else 'unread-badge'}">{
-                                "Read ✓" if book['read'] else "Not Read"}</span>
-                            <span style="margin-left: 10px;">{"⭐" * book.get('rating', 0)}</span>
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
+            if books:
+                st.write(summary)
+                if not ranked:
+                    st.caption(page_caption(results))
+                # One markdown block per page instead of one per book
+                render_started = metrics.start()
+                st.markdown("".join(book_card_html(book) for book in books), unsafe_allow_html=True)
+                metrics.stop('render.search_cards', render_started)
             else:
                 st.info("No books found matching your search.")
         st.markdown('</div>', unsafe_allow_html=True)
@@ -366,41 +578,44 @@ def main():
     elif "📚 My Library" in menu:
         st.markdown('<h2 class="subheader">My Library</h2>', unsafe_allow_html=True)
         
-        books = st.session_state.library_manager.get_all_books()
+        col_sort, col_order, col_size, col_page = st.columns(4)
+        with col_sort:
+            sort_label = st.selectbox("Sort by", list(SORT_OPTIONS))
+        with col_order:
+            descending = st.selectbox("Order", ["Ascending", "Descending"]) == "Descending"
+        with col_size:
+            page_size = st.selectbox("Books per page", PAGE_SIZES, index=1)
+        with col_page:
+            page_number = st.number_input("Page", min_value=1, value=1, step=1, key="library_page")
+        
+        # Only the visible slice of the matching books is fetched and rendered
+        filters = library_filters()
+        page = st.session_state.library_manager.query(**filters, page=page_number, page_size=page_size,
+                                                      sort_by=SORT_OPTIONS[sort_label], descending=descending)
+        render_library_filters(page)
+        render_export_button(st.session_state.library_manager, filters, SORT_OPTIONS[sort_label], descending)
+        books = page['books']
         
         if books:
+            st.caption(page_caption(page))
             # Create tabs for different views
             tab1, tab2 = st.tabs(["Card View", "Table View"])
             
             with tab1:
-                # Card view with columns
+                # Card view with columns, one markdown block per column
+                render_started = metrics.start()
                 cols = st.columns(3)
-                for i, book in enumerate(books):
-                    with cols[i % 3]:
-                        st.markdown(f"""
-                        <div class="book-card">
-                            <div class="book-title">{book['title']}</div>
-                            <div class="book-author">by {book['author']}</div>
-                            <div class="book-meta">{book['genre']} • {book['year']}</div>
-                            <div style="margin-top: 10px;">
-                                <span class="{'read-badge' if book['read'] else 'unread-badge'}">{
-                                    "Read ✓" if book['read'] else "Not Read"}</span>
-                                <span style="margin-left: 10px;">{"⭐" * book.get('rating', 0)}</span>
-                            </div>
-                        </div>
-                        """, unsafe_allow_html=True)
+                for i, col in enumerate(cols):
+                    with col:
+                        st.markdown("".join(book_card_html(book) for book in books[i::3]), unsafe_allow_html=True)
+                metrics.stop('render.library_cards', render_started)
             
             with tab2:
                 # Table view
-                df = pd.DataFrame(books)
-                if 'rating' not in df.columns:
-                    df['rating'] = 0
-                if 'date_added' not in df.columns:
-                    df['date_added'] = "Unknown"
-                
-                # Reorder columns
-                columns_order = ['title', 'author', 'year', 'genre', 'read', 'rating', 'date_added']
-                df = df[columns_order]
+                render_started = metrics.start()
+                df = st.session_state.library_manager.books_frame([book['id'] for book in books],
+                                                                  BOOK_FIELDS)
+                df['date_added'] = df['date_added'].dt.strftime('%Y-%m-%d').fillna("Unknown")
                 
                 # Rename columns
                 df.columns = ['Title', 'Author', 'Year', 'Genre', 'Read', 'Rating', 'Date Added']
@@ -412,13 +627,17 @@ def main():
                 df['Rating'] = df['Rating'].apply(lambda x: "⭐" * int(x))
                 
                 st.dataframe(df, use_container_width=True)
+                metrics.stop('render.library_table', render_started)
+        elif page['year_range'][0] is not None:
+            st.info("No books match these filters.")
         else:
             st.info("Your library is empty. Add some books to get started!")
 
     elif "📊 Statistics & Analytics" in menu:
         st.markdown('<h2 class="subheader">Library Statistics & Analytics</h2>', unsafe_allow_html=True)
         
-        stats = st.session_state.library_manager.get_statistics()
+        manager = st.session_state.library_manager
+        stats = manager.get_statistics()
         
         # Top metrics
         col1, col2, col3 = st.columns(3)
@@ -451,20 +670,9 @@ def main():
         
         with col1:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-            # Reading status pie chart
-            fig = go.Figure(data=[go.Pie(
-                labels=['Read', 'Unread'],
-                values=[stats['read_books'], stats['total_books'] - stats['read_books']],
-                hole=.6,
-                marker_colors=['#4CAF50', '#FFC107']
-            )])
-            fig.update_layout(
-                title_text="Reading Status",
-                showlegend=True,
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                title_x=0.5
-            )
+            # Reading status pie chart; figures are only rebuilt when the
+            # library version changes, and read their data under the same lock
+            fig = manager.cached('reading_status_figure', lambda: reading_status_figure(manager.get_statistics()))
             st.plotly_chart(fig, use_container_width=True)
             st.markdown('</div>', unsafe_allow_html=True)
             
@@ -472,13 +680,7 @@ def main():
             st.markdown('<div class="card">', unsafe_allow_html=True)
             # Genre distribution
             if stats['genres']:
-                genres_df = pd.DataFrame({
-                    'Genre': list(stats['genres'].keys()),
-                    'Count': list(stats['genres'].values())
-                })
-                fig = px.bar(genres_df, x='Genre', y='Count', color='Count',
-                            color_continuous_scale='Blues')
-                fig.update_layout(title_text="Books by Genre")
+                fig = manager.cached('genre_figure', lambda: genre_figure(manager.get_statistics()))
                 st.plotly_chart(fig, use_container_width=True)
             else:
                 st.info("Add books with genres to see this chart")
@@ -489,13 +691,7 @@ def main():
         st.markdown('<div class="card">', unsafe_allow_html=True)
         
         if stats['top_authors']:
-            authors_df = pd.DataFrame({
-                'Author': list(stats['top_authors'].keys()),
-                'Books': list(stats['top_authors'].values())
-            })
-            fig = px.bar(authors_df, x='Author', y='Books', color='Books',
-                        color_continuous_scale='Greens')
-            fig.update_layout(title_text="Top Authors in Your Library")
+            fig = manager.cached('author_figure', lambda: author_figure(manager.get_statistics()))
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("Add more books to see author statistics")
@@ -503,31 +699,31 @@ def main():
         st.markdown('</div>', unsafe_allow_html=True)
         
         # Reading timeline (if date_added exists)
-        books = st.session_state.library_manager.get_all_books()
-        if books and any('date_added' in book for book in books):
+        if manager.get_growth_timeline('year')['periods']:
             st.markdown('<h3 style="margin-top: 20px;">Reading Timeline</h3>', unsafe_allow_html=True)
+            resolution = GROWTH_RESOLUTIONS[st.radio("Resolution", list(GROWTH_RESOLUTIONS), horizontal=True,
+                                                     key='growth_resolution')]
+            fig = manager.cached(('timeline_figure', resolution),
+                                 lambda: timeline_figure(manager.get_growth_timeline(resolution)))
             st.markdown('<div class="card">', unsafe_allow_html=True)
-            
-            # Filter books with date_added
-            dated_books = [book for book in books if 'date_added' in book]
-            if dated_books:
-                # Create timeline dataframe
-                timeline_df = pd.DataFrame(dated_books)
-                timeline_df['date_added'] = pd.to_datetime(timeline_df['date_added'])
-                timeline_df = timeline_df.sort_values('date_added')
-                
-                # Create cumulative count
-                timeline_df['cumulative_count'] = range(1, len(timeline_df) + 1)
-                
-                # Plot timeline
-                fig = px.line(timeline_df, x='date_added', y='cumulative_count',
-                            labels={'date_added': 'Date', 'cumulative_count': 'Total Books'},
-                            title='Library Growth Over Time')
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.info("Books with dates will appear in this timeline")
-                
+            st.plotly_chart(fig, use_container_width=True)
             st.markdown('</div>', unsafe_allow_html=True)
 
+        # Totals across every hosted library, from per-library summaries
+        if library_id is not None:
+            st.markdown('<h3 style="margin-top: 20px;">All Libraries</h3>', unsafe_allow_html=True)
+            combined = get_library_pool().aggregate_statistics()
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Libraries", len(combined['libraries']))
+            col2.metric("Total Books", combined['total_books'])
+            col3.metric("Read", f"{combined['percent_read']}%")
+            st.dataframe([{'Library': name, 'Books': count} for name, count in combined['libraries'].items()],
+                         use_container_width=True, hide_index=True)
+
+    metrics.stop('page.' + re.sub(r'[^a-z]+', '_', menu.lower()).strip('_'), page_started)
+
+    if metrics.enabled or st.query_params.get('diagnostics') == '1':
+        render_diagnostics_panel()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
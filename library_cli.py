@@ -0,0 +1,203 @@
+import argparse
+import json
+import sys
+
+from library_core import (EXPORT_FORMATS, SORT_KEYS, LibraryPool, create_library_manager, import_catalog,
+                          validate_book)
+
+# Command-line access to the library in the current directory, without
+# streamlit, pandas or plotly.
+#
+#   python library_cli.py add "Dune" "Frank Herbert" --year 1965 --genre "Science Fiction"
+#   python library_cli.py list --sort year --desc
+#   python library_cli.py search tolkein
+#   python library_cli.py import catalog.csv
+#   python library_cli.py export catalog.parquet --genre Fantasy --unread
+#   python library_cli.py --json stats
+#   python library_cli.py --library branch-7 add "Emma" "Jane Austen" --year 1815
+#   python library_cli.py libraries
+
+COLUMNS = ('id', 'title', 'author', 'year', 'genre', 'read', 'rating', 'date_added')
+
+
+def print_books(books, as_json: bool) -> None:
+    for book in books:
+        if as_json:
+            print(json.dumps(book))
+        else:
+            print('\t'.join('' if book.get(column) is None else str(book.get(column)) for column in COLUMNS))
+
+
+def cmd_list(manager, args) -> int:
+    page = manager.get_books_page(args.page, args.page_size, args.sort, args.desc)
+    print_books(page['books'], args.json)
+    if not args.json:
+        print(f"# page {page['page']} of {page['pages']}, {page['total']} books", file=sys.stderr)
+    return 0
+
+
+def cmd_add(manager, args) -> int:
+    book = validate_book({'title': args.title, 'author': args.author, 'year': args.year, 'genre': args.genre,
+                          'read': args.read, 'rating': args.rating, 'date_added': args.date_added})
+    print(manager.add_book(**book))
+    return 0
+
+
+def cmd_remove(manager, args) -> int:
+    removed = manager.remove_book_by_id(args.id) if args.id is not None else manager.remove_book(args.title)
+    if not removed:
+        print("No such book", file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_search(manager, args) -> int:
+    fields = args.fields.split(',')
+    if args.exact:
+        books = manager.search_page(args.query, fields, 1, args.limit)['books']
+    else:
+        books = manager.search_ranked(args.query, fields, args.limit)
+    print_books(books, args.json)
+    return 0
+
+
+def cmd_stats(manager, args) -> int:
+    stats = manager.get_statistics()
+    if args.json:
+        print(json.dumps(stats))
+        return 0
+    print(f"Total books: {stats['total_books']}")
+    print(f"Read: {stats['read_books']} ({stats['percent_read']}%)")
+    for title, counts in (("Genres", stats['genres']), ("Top authors", stats['top_authors'])):
+        print(f"{title}:")
+        for name, count in counts.items():
+            print(f"  {name}: {count}")
+    return 0
+
+
+def cmd_import(manager, args) -> int:
+    fmt = args.format or ('csv' if args.file.lower().endswith('.csv') else 'jsonl')
+    with open(args.file, 'rb') as f:
+        added, rejected = import_catalog(manager, f, fmt)
+    print(f"Imported {added} books")
+    for row, error in rejected:
+        print(f"row {row}: {error}", file=sys.stderr)
+    return 1 if rejected else 0
+
+
+def cmd_export(manager, args) -> int:
+    fmt = args.format or args.file.rsplit('.', 1)[-1].lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Can't tell the format of {args.file}; pass --format")
+    filters = {'genres': args.genre, 'year_min': args.year_min, 'year_max': args.year_max,
+               'read': args.read, 'min_rating': args.min_rating, 'text': args.text}
+    if args.file == '-':
+        count = manager.export(sys.stdout.buffer, fmt, filters, args.sort, args.desc)
+    else:
+        with open(args.file, 'wb') as f:
+            count = manager.export(f, fmt, filters, args.sort, args.desc)
+    print(f"Exported {count} books", file=sys.stderr)
+    return 0
+
+
+def cmd_libraries(manager, args) -> int:
+    # Every library under LIBRARY_ROOT, with combined statistics
+    pool = LibraryPool(backend=args.backend, flush_interval=0, lazy=True)
+    try:
+        stats = pool.aggregate_statistics()
+    finally:
+        # Saves a summary.json for each library opened, so the next run
+        # doesn't have to open them again
+        pool.close()
+    if args.json:
+        print(json.dumps(stats))
+        return 0
+    for library_id, count in stats['libraries'].items():
+        print(f"{library_id}\t{count}")
+    print(f"# {len(stats['libraries'])} libraries, {stats['total_books']} books, "
+          f"{stats['percent_read']}% read", file=sys.stderr)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Manage the library from the command line")
+    parser.add_argument('--backend', choices=['journal', 'json', 'sqlite'],
+                        help="storage engine (default: LIBRARY_BACKEND or journal)")
+    parser.add_argument('--json', action='store_true', help="print JSON instead of text")
+    parser.add_argument('--library', help="library id (default: the library in the current directory)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = commands.add_parser('list', help="list books a page at a time")
+    list_parser.add_argument('--page', type=int, default=1)
+    list_parser.add_argument('--page-size', type=int, default=50)
+    list_parser.add_argument('--sort', choices=SORT_KEYS)
+    list_parser.add_argument('--desc', action='store_true')
+    list_parser.set_defaults(run=cmd_list)
+
+    add_parser = commands.add_parser('add', help="add a book and print its id")
+    add_parser.add_argument('title')
+    add_parser.add_argument('author')
+    add_parser.add_argument('--year', type=int, required=True)
+    add_parser.add_argument('--genre', default='Other')
+    add_parser.add_argument('--read', action='store_true')
+    add_parser.add_argument('--rating', type=int, default=0)
+    add_parser.add_argument('--date-added')
+    add_parser.set_defaults(run=cmd_add)
+
+    remove_parser = commands.add_parser('remove', help="remove a book by id or title")
+    target = remove_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--id', type=int)
+    target.add_argument('--title')
+    remove_parser.set_defaults(run=cmd_remove)
+
+    search_parser = commands.add_parser('search', help="best matches first, typos tolerated")
+    search_parser.add_argument('query')
+    search_parser.add_argument('--fields', default='title,author,genre')
+    search_parser.add_argument('--limit', type=int, default=20)
+    search_parser.add_argument('--exact', action='store_true', help="substring matches in library order")
+    search_parser.set_defaults(run=cmd_search)
+
+    stats_parser = commands.add_parser('stats', help="library statistics")
+    stats_parser.set_defaults(run=cmd_stats)
+
+    import_parser = commands.add_parser('import', help="import a CSV or JSONL catalog")
+    import_parser.add_argument('file')
+    import_parser.add_argument('--format', choices=['csv', 'jsonl'])
+    import_parser.set_defaults(run=cmd_import)
+
+    export_parser = commands.add_parser('export', help="export the library, or the books matching filters")
+    export_parser.add_argument('file', help="output path, or - for stdout")
+    export_parser.add_argument('--format', choices=list(EXPORT_FORMATS), help="default: from the file extension")
+    export_parser.add_argument('--genre', action='append', help="repeat for any of several genres")
+    export_parser.add_argument('--year-min', type=int)
+    export_parser.add_argument('--year-max', type=int)
+    status = export_parser.add_mutually_exclusive_group()
+    status.add_argument('--read', action='store_true', default=None)
+    status.add_argument('--unread', action='store_false', dest='read')
+    export_parser.add_argument('--min-rating', type=int)
+    export_parser.add_argument('--text', help="title or author contains")
+    export_parser.add_argument('--sort', choices=SORT_KEYS)
+    export_parser.add_argument('--desc', action='store_true')
+    export_parser.set_defaults(run=cmd_export)
+
+    libraries_parser = commands.add_parser('libraries', help="list every library with its book count")
+    libraries_parser.set_defaults(run=cmd_libraries)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    # Each command is one short write, so skip the background writer, and
+    # most touch a few books, so map the library instead of reading it all
+    manager = None
+    try:
+        if args.run is not cmd_libraries:
+            manager = create_library_manager(args.backend, flush_interval=0, lazy=True, library_id=args.library)
+        return args.run(manager, args)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
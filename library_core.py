@@ -0,0 +1,3077 @@
+import atexit
+import bisect
+import csv
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks (Windows); change detection still works
+    fcntl = None
+import functools
+import heapq
+import io
+import json
+import mmap
+import os
+import re
+import sqlite3
+import stat
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict
+from itertools import accumulate, compress
+from contextlib import contextmanager, nullcontext
+from datetime import date, datetime
+from typing import List, Dict, Any, Collection, Iterable, Iterator, Optional, Tuple
+
+# The library itself: storage backends, indexes and the managers. Nothing
+# here imports streamlit, pandas or plotly at load time, so scripts, the CLI
+# and batch jobs can use it without the UI stack; pandas is imported only
+# by the DataFrame helpers.
+
+SNAPSHOT_FORMAT = 'library-jsonl/1'
+
+
+def _snapshot_header(line: bytes) -> Optional[Dict[str, Any]]:
+    # The first line of a JSONL snapshot, or None for the older formats
+    if not line.startswith(b'{"format"'):
+        return None
+    try:
+        header = json.loads(line)
+    except ValueError:
+        return None
+    return header if header.get('format') == SNAPSHOT_FORMAT else None
+
+
+def _read_snapshot(path: str) -> Dict[str, Any]:
+    # library.json is the original plain list of books, a snapshot object
+    # from before snapshots were line-delimited, or a JSONL snapshot: a header
+    # line with the last applied log seq, then one book per line. JSONL books
+    # come back as a generator, so the file text is never held whole.
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return {'seq': 0, 'books': []}
+    first = f.readline()
+    header = _snapshot_header(first)
+    if header is not None:
+        return {'seq': header['seq'], 'books': _iter_snapshot_lines(f)}
+    with f:
+        data = json.loads(first + f.read())
+    if isinstance(data, list):
+        return {'seq': 0, 'books': data}
+    return {'seq': data.get('seq', 0), 'books': data.get('books', [])}
+
+
+def _iter_snapshot_lines(f) -> Iterator[Dict[str, Any]]:
+    with f:
+        for line in f:
+            yield json.loads(line)
+
+
+# The umask can only be read by setting it, so it is read once, at import
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@contextmanager
+def _atomic_file(path: str, fsync: bool = True):
+    # Write to a temp file in the same directory and rename it over the
+    # target, so a crash mid-write never leaves a truncated library behind.
+    # Without fsync the rename can still land before the data on power loss.
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.library-', suffix='.tmp', dir=directory)
+    try:
+        # mkstemp makes the file owner-only; keep the target's mode, or give
+        # a new file the one open() would, so other users can still read it
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp_path, mode)
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _atomic_write_json(path: str, data: Any, fsync: bool = True) -> None:
+    with _atomic_file(path, fsync) as f:
+        # dumps runs the C encoder; dump() streams through the pure Python one
+        f.write(json.dumps(data).encode('utf-8'))
+
+
+def _write_snapshot(path: str, seq: int, books: Collection[Dict[str, Any]], fsync: bool = True) -> None:
+    # JSONL snapshot, written a chunk at a time, plus a `<path>.idx` of book
+    # ids and line offsets so MappedBookStore can open it without a scan.
+    # Lines start with the id, and json.dumps escapes everything to ASCII,
+    # so string lengths are byte offsets.
+    ids, offsets = array('q'), array('q')
+    ascending = True
+    header = json.dumps({'format': SNAPSHOT_FORMAT, 'seq': seq, 'count': len(books)}) + '\n'
+    position = len(header)
+    chunk = [header]
+    with _atomic_file(path, fsync) as f:
+        for book in books:
+            if 'id' in book:
+                line = json.dumps({'id': book['id'], **book}) + '\n'
+                if ids is not None:
+                    ascending = ascending and (not ids or ids[-1] < book['id'])
+                    ids.append(book['id'])
+                    offsets.append(position)
+            else:
+                # Books from before ids existed; only load() can read these
+                line = json.dumps(book) + '\n'
+                ids = None
+            position += len(line)
+            chunk.append(line)
+            if len(chunk) >= 4096:
+                f.write(''.join(chunk).encode('utf-8'))
+                chunk = []
+        f.write(''.join(chunk).encode('utf-8'))
+    if ids is not None:
+        offsets.append(position)
+        _write_snapshot_index(path, seq, position, ids, offsets, ascending)
+
+
+def _write_snapshot_index(path: str, seq: int, size: int, ids: array, offsets: array, ascending: bool) -> None:
+    # A cache of the snapshot's layout, rebuilt by scanning if it goes
+    # missing or stale, so it is not fsynced
+    with _atomic_file(path + '.idx', fsync=False) as f:
+        f.write(f"{seq} {size} {len(ids)} {int(ascending)} {sys.byteorder}\n".encode())
+        f.write(ids.tobytes())
+        f.write(offsets.tobytes())
+
+
+def _read_snapshot_index(path: str, header: Dict[str, Any], size: int) -> Optional[Tuple[array, array, bool]]:
+    try:
+        with open(path + '.idx', 'rb') as f:
+            fields = f.readline().decode('ascii', 'replace').split()
+            if len(fields) != 5 or fields[:3] != [str(header['seq']), str(size), str(header['count'])] \
+                    or fields[4] != sys.byteorder:
+                return None
+            count = header['count']
+            ids, offsets = array('q'), array('q')
+            ids.frombytes(f.read(8 * count))
+            offsets.frombytes(f.read(8 * (count + 1)))
+    except (FileNotFoundError, ValueError):
+        return None
+    if len(offsets) != count + 1:
+        return None
+    return ids, offsets, fields[3] == '1'
+
+
+_LINE_ID = re.compile(rb'\{"id": (-?\d+)')
+
+
+def _scan_snapshot(data, size: int) -> Optional[Tuple[array, array, bool]]:
+    # Rebuilds the snapshot index from the mapped file; None if a book has no id
+    ids, offsets = array('q'), array('q')
+    ascending = True
+    position = data.find(b'\n') + 1
+    while position < size:
+        end = data.find(b'\n', position)
+        end = size if end < 0 else end + 1
+        match = _LINE_ID.match(data, position)
+        if match is not None:
+            book_id = int(match.group(1))
+        else:
+            book_id = json.loads(data[position:end]).get('id')
+            if book_id is None:
+                return None
+        ascending = ascending and (not ids or ids[-1] < book_id)
+        ids.append(book_id)
+        offsets.append(position)
+        position = end
+    offsets.append(position)
+    return ids, offsets, ascending
+
+
+class LibraryLock:
+    # Advisory lock on `<path>.lock`, shared by every process using the same
+    # library. The lock file also holds a generation number that writers bump,
+    # so another process can tell its copy is stale from a tiny read plus a
+    # stat of the library files, without reading the library itself, and the
+    # highest book id handed out so far, so ids are never given out twice even
+    # before the books that use them reach the disk.
+    def __init__(self, path: str, watched: List[str]):
+        self.path = path + '.lock'
+        self.watched = watched
+        self.depth = 0
+        # The state of the files the in-memory copy last matched
+        self.signature = None
+        self._synced = False
+        self._file = None
+
+    @contextmanager
+    def hold(self):
+        # Re-entrant within a process. Only code holding the manager's write
+        # lock takes it, so threads never share the open handle; changed()
+        # runs without either and reads the file through its own. Yields True
+        # for the outermost hold.
+        if self.depth == 0:
+            self._file = open(self.path, 'a+b')
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            self._synced = False
+        self.depth += 1
+        try:
+            yield self.depth == 1
+        finally:
+            self.depth -= 1
+            if self.depth == 0:
+                # Only a hold that loaded, merged or wrote moves the signature;
+                # one that just reserved ids has not seen other processes' changes
+                if self._synced:
+                    self.signature = self._signature()
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+                self._file.close()
+                self._file = None
+
+    def synced(self) -> None:
+        # Called with the lock held once the in-memory copy matches the files
+        self._synced = True
+
+    def bump(self) -> None:
+        # Called with the lock held after every write to the library files,
+        # which always follows a load or merge in the same hold
+        with self.hold():
+            generation, next_id = self._read()
+            self._write(generation + 1, next_id)
+            self.synced()
+
+    def reserve(self, start: int, count: int) -> int:
+        # First of `count` consecutive ids, none below `start` or handed out
+        # by any process before
+        with self.hold():
+            generation, next_id = self._read()
+            first = max(start, next_id)
+            self._write(generation, first + count)
+            return first
+
+    def changed(self) -> bool:
+        # False until something was loaded; cheap enough to call every rerun
+        return self.signature is not None and self._signature() != self.signature
+
+    def _signature(self) -> tuple:
+        # Never through self._file: another thread may be using or closing it
+        try:
+            with open(self.path, 'rb') as f:
+                generation = self._parse(f.read())[0]
+        except FileNotFoundError:
+            generation = 0
+        return (generation,) + tuple(_file_stat(path) for path in self.watched)
+
+    def _read(self) -> Tuple[int, int]:
+        self._file.seek(0)
+        return self._parse(self._file.read())
+
+    def _write(self, generation: int, next_id: int) -> None:
+        self._file.truncate(0)
+        self._file.write(f"{generation} {next_id}".encode())
+        self._file.flush()
+
+    @staticmethod
+    def _parse(data: bytes) -> Tuple[int, int]:
+        # "<generation> <next id>"; older lock files only hold the generation
+        try:
+            values = [int(value) for value in data.split()]
+        except ValueError:
+            return 0, 0
+        return tuple(values + [0, 0])[:2]
+
+
+def _file_stat(path: str) -> Optional[tuple]:
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (info.st_ino, info.st_size, info.st_mtime_ns)
+
+
+class JSONStorage:
+    # Rewrites the whole catalog to a single JSON file on every change
+    def __init__(self, path: str = 'library.json', fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self.guard = LibraryLock(path, [path])
+
+    def lock(self):
+        return self.guard.hold()
+
+    def reserve_ids(self, start: int, count: int) -> int:
+        return self.guard.reserve(start, count)
+
+    def changed(self) -> bool:
+        return self.guard.changed()
+
+    def read_changes(self) -> Optional[List[Dict[str, Any]]]:
+        # Any change means a full reload
+        return None
+
+    def load(self) -> List[Dict[str, Any]]:
+        with self.guard.hold():
+            books = list(_read_snapshot(self.path)['books'])
+            self.guard.synced()
+            return books
+
+    def open_mapped(self) -> None:
+        # A single JSON document can't be read a book at a time
+        return None
+
+    def save(self, books: Collection[Dict[str, Any]]) -> None:
+        with self.guard.hold():
+            _atomic_write_json(self.path, list(books), self.fsync)
+            self.guard.bump()
+
+    def record(self, records: List[Dict[str, Any]], books: Collection[Dict[str, Any]]) -> None:
+        self.save(books)
+
+
+class JournalStorage:
+    # Snapshot + append-only log. The snapshot is JSON Lines, one book per
+    # line (see _write_snapshot). Each mutation appends one small JSON line to
+    # `<path>.log`; once the log grows past the compaction threshold it is
+    # folded into a new snapshot written atomically, and the log is truncated.
+    def __init__(self, path: str = 'library.json', compact_min_records: int = 1000,
+                 compact_ratio: float = 0.25, fsync: bool = True):
+        self.path = path
+        self.log_path = path + '.log'
+        self.compact_min_records = compact_min_records
+        self.compact_ratio = compact_ratio
+        # fsync every append and snapshot, or leave flushing to the OS
+        self.fsync = fsync
+        self.seq = 0
+        self.log_records = 0
+        # Where this process stopped reading the log, and the snapshot it read;
+        # other processes' appends past the offset can be merged without a reload
+        self.log_offset = 0
+        self.snapshot_stat = None
+        self.guard = LibraryLock(path, [path, self.log_path])
+
+    def lock(self):
+        return self.guard.hold()
+
+    def reserve_ids(self, start: int, count: int) -> int:
+        return self.guard.reserve(start, count)
+
+    def changed(self) -> bool:
+        return self.guard.changed()
+
+    def read_changes(self) -> Optional[List[Dict[str, Any]]]:
+        # Records other processes appended since we last looked, or None when
+        # the snapshot was rewritten (a compaction or a bulk add) and the
+        # library has to be reloaded
+        with self.guard.hold():
+            if _file_stat(self.path) != self.snapshot_stat:
+                return None
+            records = []
+            try:
+                with open(self.log_path, 'rb') as f:
+                    if os.fstat(f.fileno()).st_size < self.log_offset:
+                        return None
+                    f.seek(self.log_offset)
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # Torn line: let load() repair the log
+                            return None
+                        records.append(record)
+                    self.log_offset = f.tell()
+            except FileNotFoundError:
+                return None if self.log_offset else []
+            self.log_records += len(records)
+            if records:
+                self.seq = records[-1]['seq']
+            self.guard.synced()
+            return records
+
+    def load(self) -> List[Dict[str, Any]]:
+        with self.guard.hold():
+            return self._load()
+
+    def _load(self) -> List[Dict[str, Any]]:
+        self.snapshot_stat = _file_stat(self.path)
+        snapshot = _read_snapshot(self.path)
+        # Replay into a dict keyed by book id so removes and updates are O(1);
+        # books from before ids existed get a placeholder key
+        books = {book.get('id', ('legacy', i)): book for i, book in enumerate(snapshot['books'])}
+        self._replay_log(snapshot['seq'], lambda record: self._apply(books, record))
+        books = list(books.values())
+        self.guard.synced()
+        if self._should_compact(books):
+            self.save(books)
+        return books
+
+    def open_mapped(self) -> Optional['MappedBookStore']:
+        # Lazy alternative to load(): the snapshot stays on disk, memory-mapped,
+        # with the log replayed on top in memory. None when the snapshot can't
+        # be mapped (an older format, or books from before ids); load() then.
+        with self.guard.hold():
+            snapshot_stat = _file_stat(self.path)
+            store = MappedBookStore.open(self.path) if snapshot_stat is not None else MappedBookStore.empty()
+            if store is None:
+                return None
+            self.snapshot_stat = snapshot_stat
+            replayable = True
+
+            def apply(record: Dict[str, Any]) -> None:
+                nonlocal replayable
+                if record['op'] == 'remove' and 'id' in record:
+                    store.remove(record['id'])
+                elif record['op'] in ('add', 'update') and 'id' in record['book']:
+                    if record['book']['id'] in store:
+                        store.update(record['book']['id'], record['book'])
+                    else:
+                        store.append(record['book'])
+                else:
+                    replayable = False
+
+            self._replay_log(store.seq, apply)
+            if not replayable:
+                return None
+            self.guard.synced()
+            # Unlike load() this never compacts: that would read every book
+            return store
+
+    def _replay_log(self, snapshot_seq: int, apply) -> None:
+        # Feeds apply() the log records newer than the snapshot
+        self.seq = snapshot_seq
+        self.log_records = 0
+        self.log_offset = 0
+        try:
+            with open(self.log_path, 'rb') as f:
+                good_offset = 0
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-append; cut it off so
+                        # the next append starts on a clean line
+                        f.close()
+                        with open(self.log_path, 'r+b') as log:
+                            log.truncate(good_offset)
+                        break
+                    good_offset += len(line)
+                    self.log_records += 1
+                    # Records already folded into the snapshot are skipped, which
+                    # covers a crash between the snapshot rename and log truncation
+                    if record['seq'] <= snapshot_seq:
+                        continue
+                    apply(record)
+                    self.seq = record['seq']
+                self.log_offset = good_offset
+        except FileNotFoundError:
+            pass
+
+    def save(self, books: Collection[Dict[str, Any]]) -> None:
+        metrics.incr('journal_snapshot')
+        with self.guard.hold():
+            _write_snapshot(self.path, self.seq, books, self.fsync)
+            with open(self.log_path, 'w', encoding='utf-8'):
+                pass
+            self.log_records = 0
+            self.log_offset = 0
+            self.snapshot_stat = _file_stat(self.path)
+            self.guard.bump()
+
+    def record(self, records: List[Dict[str, Any]], books: Collection[Dict[str, Any]]) -> None:
+        # Appends the mutation records ({'op': 'add' | 'update', 'book': ...} or
+        # {'op': 'remove', 'id': ...}) in one write; a batch big enough to
+        # trigger compaction goes straight to a snapshot
+        if len(records) >= self._compact_threshold(books):
+            self.save(books)
+        else:
+            self._append(records, books)
+
+    def _append(self, records: List[Dict[str, Any]], books: Collection[Dict[str, Any]]) -> None:
+        lines = []
+        for record in records:
+            self.seq += 1
+            record['seq'] = self.seq
+            lines.append(json.dumps(record) + '\n')
+        with self.guard.hold():
+            with open(self.log_path, 'ab') as f:
+                f.write(''.join(lines).encode('utf-8'))
+                self.log_offset = f.tell()
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.guard.bump()
+            self.log_records += len(records)
+            if self._should_compact(books):
+                self.save(books)
+
+    def _compact_threshold(self, books: Collection[Dict[str, Any]]) -> int:
+        return max(self.compact_min_records, int(len(books) * self.compact_ratio))
+
+    def _should_compact(self, books: Collection[Dict[str, Any]]) -> bool:
+        return self.log_records >= self._compact_threshold(books)
+
+    @staticmethod
+    def _apply(books: Dict[Any, Dict[str, Any]], record: Dict[str, Any]) -> None:
+        op = record['op']
+        if op == 'add':
+            book = record['book']
+            books[book.get('id', ('legacy', record['seq']))] = book
+        elif op == 'update':
+            books[record['book']['id']] = record['book']
+        elif op == 'remove' and 'id' in record:
+            books.pop(record['id'], None)
+        elif op == 'remove':
+            # Logs written before books had ids remove by title
+            title = record['title'].lower()
+            for key, book in books.items():
+                if book['title'].lower() == title:
+                    del books[key]
+                    break
+
+
+BOOK_FIELDS = ('title', 'author', 'year', 'genre', 'read', 'rating', 'date_added')
+
+SORT_KEYS = ('title', 'author', 'year', 'genre', 'rating', 'date_added')
+
+
+def _page_bounds(total: int, page: int, page_size: int) -> Tuple[int, int, int]:
+    # Clamps a 1-based page number; returns (page, page count, start offset)
+    pages = max(1, -(-total // page_size))
+    page = min(max(page, 1), pages)
+    return page, pages, (page - 1) * page_size
+
+
+def _page(books: List[Dict[str, Any]], total: int, page: int, pages: int, page_size: int) -> Dict[str, Any]:
+    return {'books': books, 'total': total, 'page': page, 'pages': pages, 'page_size': page_size}
+
+
+def _normalize(value: Any) -> str:
+    return str(value or '').lower()
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    # Levenshtein distance counting an adjacent transposition ("tolkein") as
+    # one edit. Gives up once every cell in a row exceeds `limit` and returns
+    # limit + 1.
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if before is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def _fuzzy_similarity(query: str, text: str, floor: float = 0.0, memo: Dict[tuple, float] = None) -> float:
+    # Average over the query's words of the best word match in the text, each
+    # scored 1 - distance / length. Returns 0 as soon as the average can no
+    # longer reach `floor`. Word pairs repeat a lot across a catalog (authors,
+    # common title words), so callers scoring many texts pass a shared memo.
+    query_words = query.split()
+    text_words = re.findall(r'\w+', text)
+    if not query_words or not text_words:
+        return 0.0
+    if memo is None:
+        memo = {}
+    total = 0.0
+    for n, word in enumerate(query_words):
+        best = 0.0
+        for candidate in text_words:
+            pair = (word, candidate)
+            similarity = memo.get(pair)
+            if similarity is None:
+                length = max(len(word), len(candidate))
+                limit = length // 2
+                distance = _edit_distance(word, candidate, limit)
+                # Anything further than half the word away counts as no match
+                similarity = memo[pair] = 1 - distance / length if distance <= limit else 0.0
+            best = max(best, similarity)
+        total += best
+        if (total + len(query_words) - n - 1) / len(query_words) <= floor:
+            return 0.0
+    return total / len(query_words)
+
+
+def _similarity(query: str, text: str, floor: float = 0.0, memo: Dict[tuple, float] = None) -> float:
+    # 1.0 for an exact match; 0.8-1.0 for a substring, higher when it covers
+    # more of the text or starts a word; at most 0.75 for a fuzzy match, so a
+    # real substring always outranks a typo
+    if not query or not text:
+        return 0.0
+    position = text.find(query)
+    if position >= 0:
+        score = 0.8 + 0.15 * len(query) / len(text)
+        if position == 0 or not text[position - 1].isalnum():
+            score += 0.05
+        return score
+    if floor >= 0.75:
+        return 0.0
+    return 0.75 * _fuzzy_similarity(query, text, floor / 0.75, memo)
+
+
+class StringPool:
+    # Dictionary encoding: each distinct string is stored once and columns
+    # hold its integer code
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+# Rough CPython sizes for memory_usage(), measured on 64-bit builds: a short
+# str, a dict entry with its int key, a book dict, the title, search,
+# statistics, facet and growth indexes per book, and the search index alone
+STRING_BYTES = 65
+DICT_ENTRY_BYTES = 100
+BOOK_DICT_BYTES = 650
+INDEX_BYTES_PER_BOOK = 2600
+SEARCH_INDEX_BYTES_PER_BOOK = 2500
+
+MISSING_YEAR = -2 ** 31
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# What BookStore's year and rating columns can hold (MISSING_YEAR is taken)
+YEAR_LIMITS = (MISSING_YEAR + 1, 2 ** 31 - 1)
+RATING_LIMITS = (-128, 127)
+
+
+def _date_ordinal(value: Any) -> int:
+    # 0 stands for "no date_added"; anything else must be YYYY-MM-DD
+    if not value:
+        return 0
+    return date.fromisoformat(value).toordinal()
+
+
+def _column_int(value: Any, field: str, limits: Tuple[int, int]) -> int:
+    low, high = limits
+    if not isinstance(value, int) or not low <= value <= high:
+        raise ValueError(f"{field} must be a whole number between {low} and {high}, got {value!r}")
+    return value
+
+
+class BookStore:
+    # Columnar catalog: one typed array per numeric field, dictionary-encoded
+    # author and genre columns and a plain list of titles, instead of one dict
+    # per book. Rows stay in library order; removed rows are tombstoned and
+    # squeezed out once they pile up. Book dicts are only built on request.
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self._ids = array('q')
+        self._titles = []
+        self._authors = array('I')
+        self._genres = array('I')
+        self._years = array('i')
+        self._ratings = array('b')
+        self._read = bytearray()
+        self._dates = array('i')
+        self._alive = bytearray()
+        self._author_pool = StringPool()
+        self._genre_pool = StringPool()
+        self._rows = {}
+        self._dead = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, book_id: int) -> bool:
+        return book_id in self._rows
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for row, alive in enumerate(self._alive):
+            if alive:
+                yield self._book(row)
+
+    def ids(self) -> List[int]:
+        return [book_id for book_id, alive in zip(self._ids, self._alive) if alive]
+
+    def nbytes(self) -> int:
+        # The typed columns exactly; titles, pooled names and the id -> row
+        # dict at typical CPython sizes
+        columns = (self._ids, self._authors, self._genres, self._years, self._ratings, self._dates)
+        strings = len(self._titles) + len(self._author_pool.values) + len(self._genre_pool.values)
+        return (sum(column.itemsize * len(column) for column in columns) + len(self._read) + len(self._alive)
+                + strings * STRING_BYTES + len(self._rows) * DICT_ENTRY_BYTES)
+
+    def get(self, book_id: int) -> Dict[str, Any]:
+        row = self._rows.get(book_id)
+        return None if row is None else self._book(row)
+
+    def get_many(self, ids: Iterable[int]) -> List[Dict[str, Any]]:
+        rows = self._rows
+        return [self._book(rows[book_id]) for book_id in ids]
+
+    def append(self, book: Dict[str, Any]) -> None:
+        # Convert and check everything first so a bad value leaves the
+        # columns untouched; after the id nothing can fail
+        values = self._encode(book)
+        self._ids.append(book['id'])
+        self._titles.append(values[0])
+        self._authors.append(values[1])
+        self._genres.append(values[2])
+        self._years.append(values[3])
+        self._ratings.append(values[4])
+        self._read.append(values[5])
+        self._dates.append(values[6])
+        self._alive.append(1)
+        self._rows[book['id']] = len(self._ids) - 1
+
+    def update(self, book_id: int, book: Dict[str, Any]) -> None:
+        row = self._rows[book_id]
+        (self._titles[row], self._authors[row], self._genres[row], self._years[row],
+         self._ratings[row], self._read[row], self._dates[row]) = self._encode(book)
+
+    def remove(self, book_id: int) -> Dict[str, Any]:
+        row = self._rows.pop(book_id, None)
+        if row is None:
+            return None
+        book = self._book(row)
+        self._alive[row] = 0
+        self._titles[row] = None
+        self._dead += 1
+        if self._dead > 1024 and self._dead > len(self._rows):
+            self._compact()
+        return book
+
+    def sorted_ids(self, field: str, descending: bool = False) -> List[int]:
+        # Sorts row numbers by column values, so no book dicts are built
+        rows = [row for row, alive in enumerate(self._alive) if alive]
+        if field == 'title':
+            titles = self._titles
+            key = lambda row: titles[row].lower()
+        elif field in ('author', 'genre'):
+            pool = self._author_pool if field == 'author' else self._genre_pool
+            codes = self._authors if field == 'author' else self._genres
+            # Rank each distinct name once instead of lowercasing per row
+            order = sorted(range(len(pool.values)), key=lambda code: pool.values[code].lower())
+            rank = [0] * len(order)
+            for position, code in enumerate(order):
+                rank[code] = position
+            key = lambda row: rank[codes[row]]
+        else:
+            column = {'year': self._years, 'rating': self._ratings, 'date_added': self._dates}[field]
+            key = column.__getitem__
+        rows.sort(key=key, reverse=descending)
+        ids = self._ids
+        return [ids[row] for row in rows]
+
+    def to_frame(self, ids: Iterable[int] = None, columns=None):
+        # Builds a DataFrame straight from the column arrays: numeric columns
+        # are copied in bulk and author/genre become categoricals over the pools
+        import numpy as np
+        import pandas as pd
+
+        columns = list(columns or ('id',) + BOOK_FIELDS)
+        if ids is None:
+            rows = np.flatnonzero(np.frombuffer(self._alive, dtype=np.uint8))
+        else:
+            rows = np.fromiter((self._rows[book_id] for book_id in ids), dtype=np.int64)
+        data = {}
+        for column in columns:
+            if column == 'id':
+                data[column] = np.frombuffer(self._ids, dtype=np.int64)[rows]
+            elif column == 'title':
+                data[column] = [self._titles[row] for row in rows]
+            elif column in ('author', 'genre'):
+                pool = self._author_pool if column == 'author' else self._genre_pool
+                codes = np.frombuffer(self._authors if column == 'author' else self._genres, dtype=np.uint32)[rows]
+                data[column] = pd.Categorical.from_codes(codes.astype(np.int64), categories=pool.values)
+            elif column == 'year':
+                years = np.frombuffer(self._years, dtype=np.int32)[rows]
+                data[column] = pd.array(years, dtype='Int32')
+                data[column][years == MISSING_YEAR] = pd.NA
+            elif column == 'read':
+                data[column] = np.frombuffer(self._read, dtype=np.uint8)[rows].astype(bool)
+            elif column == 'rating':
+                data[column] = np.frombuffer(self._ratings, dtype=np.int8)[rows]
+            elif column == 'date_added':
+                ordinals = np.frombuffer(self._dates, dtype=np.int32)[rows].astype(np.int64)
+                dates = (ordinals - EPOCH_ORDINAL).astype('datetime64[D]')
+                dates[ordinals == 0] = np.datetime64('NaT')
+                data[column] = dates
+            else:
+                raise ValueError(f"Unknown column: {column}")
+        return pd.DataFrame(data, columns=columns)
+
+    def _encode(self, book: Dict[str, Any]) -> tuple:
+        # Row values, each checked against its column's type; the pools are
+        # only touched once every check has passed
+        year = book.get('year')
+        year = MISSING_YEAR if year is None else _column_int(year, 'year', YEAR_LIMITS)
+        rating = _column_int(book.get('rating') or 0, 'rating', RATING_LIMITS)
+        date_added = _date_ordinal(book.get('date_added'))
+        title, author = book['title'], book['author']
+        return (
+            title,
+            self._author_pool.code(author),
+            self._genre_pool.code(book.get('genre') or ''),
+            year,
+            rating,
+            1 if book.get('read') else 0,
+            date_added
+        )
+
+    def _book(self, row: int) -> Dict[str, Any]:
+        year = self._years[row]
+        book = {
+            'id': self._ids[row],
+            'title': self._titles[row],
+            'author': self._author_pool.values[self._authors[row]],
+            'year': None if year == MISSING_YEAR else year,
+            'genre': self._genre_pool.values[self._genres[row]],
+            'read': bool(self._read[row]),
+            'rating': self._ratings[row]
+        }
+        if self._dates[row]:
+            book['date_added'] = date.fromordinal(self._dates[row]).isoformat()
+        return book
+
+    def _compact(self) -> None:
+        # Rebuilds the columns (and pools, dropping names no longer used)
+        # without the tombstoned rows
+        books = list(self)
+        self.clear()
+        for book in books:
+            self.append(book)
+
+
+class MappedBookStore:
+    # BookStore's interface over a memory-mapped JSONL snapshot, for lazy
+    # loading: opening it reads only the ids and line offsets, and a book is
+    # parsed from the mapping when it is asked for. Books added or changed
+    # since the snapshot are kept in memory on top of it. Sorting and
+    # to_frame still read every book. The mapping outlives a compaction that
+    # renames a new snapshot over the file, so this needs POSIX renames.
+    def __init__(self, data, seq: int, ids: array, offsets: array, ascending: bool):
+        self.seq = seq
+        self._data = data
+        self._offsets = offsets
+        self._mapped = len(ids)
+        # Rows in library order: the snapshot's lines, then appended books
+        self._ids = ids
+        self._alive = bytearray(b'\x01') * len(ids)
+        self._changed = {}
+        self._appended = {}
+        # Snapshot ids are normally ascending and found by bisection;
+        # otherwise they get a dict
+        self._snapshot_rows = None if ascending else {book_id: row for row, book_id in enumerate(ids)}
+        self._dead = 0
+
+    @classmethod
+    def open(cls, path: str) -> Optional['MappedBookStore']:
+        if os.name == 'nt':
+            return None
+        with open(path, 'rb') as f:
+            header = _snapshot_header(f.readline())
+            if header is None:
+                return None
+            size = os.fstat(f.fileno()).st_size
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        index = _read_snapshot_index(path, header, size)
+        if index is None:
+            index = _scan_snapshot(data, size)
+            if index is None:
+                return None
+            _write_snapshot_index(path, header['seq'], size, *index)
+        return cls(data, header['seq'], *index)
+
+    @classmethod
+    def empty(cls) -> 'MappedBookStore':
+        return cls(b'', 0, array('q'), array('q', [0]), True)
+
+    def __len__(self) -> int:
+        return len(self._ids) - self._dead
+
+    def __contains__(self, book_id: int) -> bool:
+        return self._row(book_id) is not None
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for row, alive in enumerate(self._alive):
+            if alive:
+                yield self._book(row)
+
+    def ids(self) -> List[int]:
+        return list(compress(self._ids, self._alive))
+
+    def max_id(self) -> int:
+        return max(self._ids, default=0)
+
+    def nbytes(self) -> int:
+        # The mapped file is page cache, not ours; count the index arrays and
+        # what sits in memory on top of them
+        rows = len(self._appended) + len(self._snapshot_rows or ())
+        return (len(self._ids) * 16 + len(self._alive) + rows * DICT_ENTRY_BYTES
+                + len(self._changed) * BOOK_DICT_BYTES)
+
+    def get(self, book_id: int) -> Dict[str, Any]:
+        row = self._row(book_id)
+        return None if row is None else self._book(row)
+
+    def get_many(self, ids: Iterable[int]) -> List[Dict[str, Any]]:
+        books = []
+        for book_id in ids:
+            row = self._row(book_id)
+            if row is None:
+                raise KeyError(book_id)
+            books.append(self._book(row))
+        return books
+
+    def append(self, book: Dict[str, Any]) -> None:
+        book = self._clean(book)
+        row = len(self._ids)
+        self._ids.append(book['id'])
+        self._alive.append(1)
+        self._changed[row] = book
+        self._appended[book['id']] = row
+
+    def update(self, book_id: int, book: Dict[str, Any]) -> None:
+        row = self._row(book_id)
+        if row is None:
+            raise KeyError(book_id)
+        self._changed[row] = self._clean({**book, 'id': book_id})
+
+    def remove(self, book_id: int) -> Dict[str, Any]:
+        row = self._row(book_id)
+        if row is None:
+            return None
+        book = self._book(row)
+        self._alive[row] = 0
+        self._changed.pop(row, None)
+        self._appended.pop(book_id, None)
+        self._dead += 1
+        return book
+
+    def sorted_ids(self, field: str, descending: bool = False) -> List[int]:
+        # Same order as BookStore.sorted_ids, from parsed books
+        if field in ('title', 'author', 'genre'):
+            key = lambda book: book[field].lower()
+        elif field == 'year':
+            key = lambda book: MISSING_YEAR if book['year'] is None else book['year']
+        elif field == 'date_added':
+            key = lambda book: _date_ordinal(book.get('date_added'))
+        else:
+            key = lambda book: book[field]
+        keyed = [(key(book), book['id']) for book in self]
+        keyed.sort(key=lambda item: item[0], reverse=descending)
+        return [book_id for _, book_id in keyed]
+
+    def to_frame(self, ids: Iterable[int] = None, columns=None):
+        store = BookStore()
+        for book in self if ids is None else self.get_many(ids):
+            store.append(book)
+        return store.to_frame(None, columns)
+
+    def _row(self, book_id: int) -> Optional[int]:
+        row = self._appended.get(book_id)
+        if row is None:
+            if self._snapshot_rows is not None:
+                row = self._snapshot_rows.get(book_id)
+            else:
+                position = bisect.bisect_left(self._ids, book_id, 0, self._mapped)
+                if position < self._mapped and self._ids[position] == book_id:
+                    row = position
+        return row if row is not None and self._alive[row] else None
+
+    def _book(self, row: int) -> Dict[str, Any]:
+        book = self._changed.get(row)
+        if book is not None:
+            return dict(book)
+        return self._clean(json.loads(self._data[self._offsets[row]:self._offsets[row + 1]]))
+
+    @staticmethod
+    def _clean(book: Dict[str, Any]) -> Dict[str, Any]:
+        # The book as BookStore would hand it back. Whatever BookStore would
+        # reject (a bad date, a year or rating its columns can't hold)
+        # raises here, so a lazily loaded library can't save it either.
+        _date_ordinal(book.get('date_added'))
+        if book.get('year') is not None:
+            _column_int(book['year'], 'year', YEAR_LIMITS)
+        _column_int(book.get('rating') or 0, 'rating', RATING_LIMITS)
+        clean = {
+            'id': book['id'],
+            'title': book['title'],
+            'author': book['author'],
+            'year': book.get('year'),
+            'genre': book.get('genre') or '',
+            'read': bool(book.get('read')),
+            'rating': book.get('rating') or 0
+        }
+        if book.get('date_added'):
+            clean['date_added'] = book['date_added']
+        return clean
+
+
+class TitleIndex:
+    # Normalized title -> ids of the books with that title
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self.ids = {}
+
+    def rebuild(self, books: Iterable[Dict[str, Any]]) -> None:
+        self.clear()
+        self.add_many(books)
+
+    def add_many(self, books: List[Dict[str, Any]]) -> None:
+        for book in books:
+            self.add(book)
+
+    def add(self, book: Dict[str, Any]) -> None:
+        key = _normalize(book['title'])
+        if key in self.ids:
+            self.ids[key].add(book['id'])
+        else:
+            self.ids[key] = {book['id']}
+
+    def remove(self, book: Dict[str, Any]) -> None:
+        key = _normalize(book['title'])
+        ids = self.ids[key]
+        ids.discard(book['id'])
+        if not ids:
+            del self.ids[key]
+
+    def first(self, title: str) -> int:
+        # Ids grow with insertion, so the smallest is the earliest added
+        ids = self.ids.get(_normalize(title))
+        return min(ids) if ids else None
+
+
+class TrigramIndex:
+    # Inverted index from lowercase trigrams to book ids, kept per field so a
+    # search only touches the fields it asks for. A substring query intersects
+    # the posting sets of its trigrams and checks the few surviving candidates
+    # against the pre-lowercased text.
+    FIELDS = ('title', 'author', 'genre')
+    # Ranked search: a title hit counts for more than an author or genre hit
+    WEIGHTS = {'title': 1.0, 'author': 0.95, 'genre': 0.7}
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self._text = {field: {} for field in self.FIELDS}
+        self._postings = {field: {} for field in self.FIELDS}
+        # Distinct words -> number of texts using them, per field; only built
+        # once a fuzzy query is too short for the trigram filter
+        self._words = {field: None for field in self.FIELDS}
+
+    def __len__(self) -> int:
+        return len(self._text['title'])
+
+    def rebuild(self, books: Iterable[Dict[str, Any]]) -> None:
+        self.clear()
+        self.add_many(books)
+
+    def add_many(self, books: List[Dict[str, Any]]) -> None:
+        for book in books:
+            self.add(book)
+
+    def add(self, book: Dict[str, Any]) -> None:
+        key = book['id']
+        for field in self.FIELDS:
+            text = _normalize(book.get(field))
+            if field != 'title':
+                # Authors and genres repeat; keep one copy of each lowercased name
+                text = sys.intern(text)
+            self._text[field][key] = text
+            postings = self._postings[field]
+            for gram in _trigrams(text):
+                if gram in postings:
+                    postings[gram].add(key)
+                else:
+                    postings[gram] = {key}
+            if self._words[field] is not None:
+                self._words[field].update(set(re.findall(r'\w+', text)))
+
+    def remove(self, book: Dict[str, Any]) -> None:
+        key = book['id']
+        for field in self.FIELDS:
+            text = self._text[field].pop(key)
+            postings = self._postings[field]
+            for gram in _trigrams(text):
+                keys = postings[gram]
+                keys.discard(key)
+                if not keys:
+                    del postings[gram]
+            words = self._words[field]
+            if words is not None:
+                for word in set(re.findall(r'\w+', text)):
+                    words[word] -= 1
+                    if not words[word]:
+                        del words[word]
+
+    def search_keys(self, query: str, fields=('title', 'author')) -> List[int]:
+        # Matching book ids in library order; callers slice before materializing
+        query = _normalize(query)
+        matches = set()
+        for field in fields:
+            matches |= self._search_field(field, query)
+        return sorted(matches)
+
+    def rank(self, query: str, fields=('title', 'author', 'genre'), limit: int = 20,
+             min_score: float = 0.4, max_candidates: int = 2000) -> List[Tuple[int, float]]:
+        # Top `limit` (id, score) pairs, best first, ties in library order.
+        # Substring hits come straight from the index and are cheap to score,
+        # so all of them are. Fuzzy matches score at most 0.75 of a field's
+        # weight, so they are only looked for while that can still beat the
+        # weakest entry of the bounded heap, and then only among the books
+        # sharing the most trigrams with the query.
+        query = _normalize(query).strip()
+        if not query or limit <= 0:
+            return []
+        heap = []
+        scored = set()
+
+        def offer(key: int, score: float) -> None:
+            entry = (score, -key)
+            if len(heap) < limit:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+        hits = {}
+        for field in fields:
+            weight = self.WEIGHTS[field]
+            texts = self._text[field]
+            for key in self._search_field(field, query):
+                score = weight * _similarity(query, texts[key])
+                if score > hits.get(key, 0.0):
+                    hits[key] = score
+        for key, score in hits.items():
+            offer(key, score)
+        scored.update(hits)
+
+        def floor() -> float:
+            return max(min_score, heap[0][0] if len(heap) == limit else 0.0)
+
+        fuzzy_fields = [field for field in fields if 0.75 * self.WEIGHTS[field] > floor()]
+        if fuzzy_fields:
+            shared = Counter()
+            memo = {}
+            for field in fuzzy_fields:
+                for key, count in self._candidates(field, query).items():
+                    if count > shared[key]:
+                        shared[key] = count
+            for key, _ in shared.most_common(max_candidates):
+                bar = floor()
+                score = hits.get(key, 0.0)
+                for field in fuzzy_fields:
+                    weight = self.WEIGHTS[field]
+                    if 0.75 * weight > max(score, bar):
+                        score = max(score, weight * _similarity(query, self._text[field][key],
+                                                                max(score, bar) / weight, memo))
+                if score >= min_score and key not in scored:
+                    offer(key, score)
+        return [(-key, score) for score, key in sorted(heap, reverse=True) if score >= min_score]
+
+    def _candidates(self, field: str, query: str) -> Dict[int, int]:
+        # Book id -> number of query trigrams its text shares. Each edit
+        # destroys at most three trigrams (a transposition, which counts as
+        # one edit, four), so a book within `edits` edits shares
+        # at least `needed` of them, and by pigeonhole must appear in one of the
+        # n - needed + 1 shortest posting lists; only those are scanned, the
+        # rest are probed for the survivors. A query with no more than
+        # 4 * edits trigrams can lose all of them to a single typo ("dnue" for
+        # "dune"), so short queries look for close words instead.
+        grams = _trigrams(query)
+        if not grams:
+            return {}
+        edits = 1 + len(query) // 8
+        needed = len(grams) - 4 * edits
+        if needed < 1:
+            return self._close_words(field, query, edits)
+        postings = self._postings[field]
+        lists = sorted((postings.get(gram, set()) for gram in grams), key=len)
+        split = len(lists) - needed + 1
+        counts = Counter()
+        for keys in lists[:split]:
+            counts.update(keys)
+        for keys in lists[split:]:
+            counts.update(counts.keys() & keys)
+        return {key: count for key, count in counts.items() if count >= needed}
+
+    def _close_words(self, field: str, query: str, edits: int) -> Dict[int, int]:
+        # Book id -> number of query words with a word within `edits` edits in
+        # its text. The field's distinct words are compared with each query
+        # word, and the books holding a close one come from the trigram index.
+        # Words shorter than three letters are left out on both sides.
+        words = self._words[field]
+        if words is None:
+            # Built whole before it is published: readers share this index
+            words = Counter()
+            for text, count in Counter(self._text[field].values()).items():
+                for word in set(re.findall(r'\w+', text)):
+                    words[word] += count
+            self._words[field] = words
+        counts = Counter()
+        for query_word in set(query.split()):
+            if len(query_word) < 3:
+                continue
+            # An edit removes at most one of the word's letters, so a close
+            # word lacks at most `edits` of them: a cheap test before the DP
+            letters = set(query_word)
+            keys = set()
+            for word in words:
+                if (len(word) >= 3 and len(letters.difference(word)) <= edits
+                        and _edit_distance(query_word, word, edits) <= edits):
+                    keys |= self._search_field(field, word)
+            counts.update(keys)
+        return counts
+
+    def _search_field(self, field: str, query: str) -> set:
+        texts = self._text[field]
+        # Queries shorter than a trigram match a large share of the catalog
+        # anyway, so scan the normalized text instead
+        if len(query) < 3:
+            return {key for key, text in texts.items() if query in text}
+        postings = self._postings[field]
+        candidates = []
+        for gram in _trigrams(query):
+            keys = postings.get(gram)
+            if not keys:
+                return set()
+            candidates.append(keys)
+        candidates.sort(key=len)
+        keys = candidates[0].intersection(*candidates[1:])
+        if len(query) == 3:
+            return keys
+        return {key for key in keys if query in texts[key]}
+
+
+class TopCounter:
+    # Counter with O(1) increment/decrement and an O(k) top-k read. Keys sit in
+    # buckets of equal count, and the non-empty buckets form a linked list
+    # ordered by count (LFU style), with bucket 0 as the sentinel. Within a
+    # bucket, keys are in the order they reached that count.
+    def __init__(self):
+        self.counts = {}
+        self._buckets = {0: {}}
+        self._up = {0: 0}
+        self._down = {0: 0}
+
+    def increment(self, key: Any) -> None:
+        count = self.counts.get(key, 0)
+        new = count + 1
+        if new not in self._buckets:
+            self._link_above(count, new)
+        self._buckets[new][key] = None
+        if count:
+            del self._buckets[count][key]
+            self._unlink_if_empty(count)
+        self.counts[key] = new
+
+    def decrement(self, key: Any) -> None:
+        count = self.counts[key]
+        new = count - 1
+        if new:
+            if new not in self._buckets:
+                self._link_above(self._down[count], new)
+            self._buckets[new][key] = None
+            self.counts[key] = new
+        else:
+            del self.counts[key]
+        del self._buckets[count][key]
+        self._unlink_if_empty(count)
+
+    def most_common(self, k: int) -> List[tuple]:
+        result = []
+        count = self._down[0]
+        while count and len(result) < k:
+            for key in self._buckets[count]:
+                if len(result) == k:
+                    break
+                result.append((key, count))
+            count = self._down[count]
+        return result
+
+    def _link_above(self, count: int, new: int) -> None:
+        up = self._up[count]
+        self._up[count] = new
+        self._down[new] = count
+        self._up[new] = up
+        self._down[up] = new
+        self._buckets[new] = {}
+
+    def _unlink_if_empty(self, count: int) -> None:
+        if self._buckets[count]:
+            return
+        up = self._up.pop(count)
+        down = self._down.pop(count)
+        self._up[down] = up
+        self._down[up] = down
+        del self._buckets[count]
+
+
+class LibraryStats:
+    # Aggregates behind get_statistics, updated per mutation so reading them
+    # does not depend on the catalog size
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self.total_books = 0
+        self.read_books = 0
+        self.genres = {}
+        self.authors = TopCounter()
+
+    def rebuild(self, books: Iterable[Dict[str, Any]]) -> None:
+        self.clear()
+        self.add_many(books)
+
+    def add_many(self, books: List[Dict[str, Any]]) -> None:
+        for book in books:
+            self.add(book)
+
+    def add(self, book: Dict[str, Any]) -> None:
+        self.total_books += 1
+        if book['read']:
+            self.read_books += 1
+        genre = book['genre']
+        self.genres[genre] = self.genres.get(genre, 0) + 1
+        self.authors.increment(book['author'])
+
+    def remove(self, book: Dict[str, Any]) -> None:
+        self.total_books -= 1
+        if book['read']:
+            self.read_books -= 1
+        genre = book['genre']
+        self.genres[genre] -= 1
+        if not self.genres[genre]:
+            del self.genres[genre]
+        self.authors.decrement(book['author'])
+
+    def summary(self, top_authors: Optional[int] = 5) -> Dict[str, Any]:
+        # top_authors=None lists every author
+        if top_authors is None:
+            top_authors = len(self.authors.counts)
+        total_books = self.total_books
+        percent_read = (self.read_books / total_books * 100) if total_books > 0 else 0
+        return {
+            'total_books': total_books,
+            'read_books': self.read_books,
+            'percent_read': round(percent_read, 2),
+            'genres': dict(self.genres),
+            'top_authors': dict(self.authors.most_common(top_authors))
+        }
+
+
+GROWTH_RESOLUTIONS = ('day', 'month', 'year')
+
+
+def _growth_series(periods: List[str], added: List[int]) -> Dict[str, List[Any]]:
+    return {'periods': periods, 'added': added, 'total': list(accumulate(added))}
+
+
+class GrowthTimeline:
+    # Books per day and per month of date_added, adjusted on every add and
+    # remove (a removed book comes off the day it was added), with each set
+    # of period keys kept sorted. A growth series is then one running sum
+    # over the periods, however many books there are.
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self.counts = {'day': {}, 'month': {}}
+        self.periods = {'day': [], 'month': []}
+
+    def rebuild(self, books: Iterable[Dict[str, Any]]) -> None:
+        self.clear()
+        dates = [book['date_added'] for book in books if book.get('date_added')]
+        for resolution, width in (('day', 10), ('month', 7)):
+            counts = Counter(value[:width] for value in dates)
+            self.counts[resolution] = dict(counts)
+            self.periods[resolution] = sorted(counts)
+
+    def add_many(self, books: List[Dict[str, Any]]) -> None:
+        # Only a period seen for the first time is inserted into a sorted list
+        for book in books:
+            self.add(book)
+
+    def add(self, book: Dict[str, Any]) -> None:
+        if book.get('date_added'):
+            self._adjust('day', book['date_added'][:10], 1)
+            self._adjust('month', book['date_added'][:7], 1)
+
+    def remove(self, book: Dict[str, Any]) -> None:
+        if book.get('date_added'):
+            self._adjust('day', book['date_added'][:10], -1)
+            self._adjust('month', book['date_added'][:7], -1)
+
+    def series(self, resolution: str = 'day') -> Dict[str, List[Any]]:
+        # Books added per period and the running total, oldest period first;
+        # years are folded from the months
+        if resolution not in GROWTH_RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        source = 'day' if resolution == 'day' else 'month'
+        counts = self.counts[source]
+        periods, added = [], []
+        for period in self.periods[source]:
+            count = counts[period]
+            if resolution == 'year':
+                period = period[:4]
+                if periods and periods[-1] == period:
+                    added[-1] += count
+                    continue
+            periods.append(period)
+            added.append(count)
+        return _growth_series(periods, added)
+
+    def _adjust(self, resolution: str, period: str, delta: int) -> None:
+        counts = self.counts[resolution]
+        count = counts.get(period, 0) + delta
+        if count:
+            if period not in counts:
+                bisect.insort(self.periods[resolution], period)
+            counts[period] = count
+        else:
+            del counts[period]
+            periods = self.periods[resolution]
+            del periods[bisect.bisect_left(periods, period)]
+
+
+def _set_bit(bits: bytearray, key: int) -> None:
+    index = key >> 3
+    if index >= len(bits):
+        # Grow geometrically so appending ids stays amortized O(1)
+        bits.extend(bytes(max(index + 1, 2 * len(bits)) - len(bits)))
+    bits[index] |= 1 << (key & 7)
+
+
+def _clear_bit(bits: bytearray, key: int) -> None:
+    index = key >> 3
+    if index < len(bits):
+        bits[index] &= ~(1 << (key & 7)) & 0xFF
+
+
+def _ids_bitmap(ids: Iterable[int]) -> int:
+    bits = bytearray()
+    for key in ids:
+        _set_bit(bits, key)
+    return int.from_bytes(bits, 'little')
+
+
+def _bitmap_ids(bitmap: int) -> List[int]:
+    # Set bit positions in ascending order. The binary string is scanned with
+    # str.find, which skips runs of zeros at C speed.
+    text = bin(bitmap)[:1:-1]
+    ids = []
+    position = text.find('1')
+    while position != -1:
+        ids.append(position)
+        position = text.find('1', position + 1)
+    return ids
+
+
+class FacetIndex:
+    # Bitmaps for the categorical fields (bit i set = book id i has that value)
+    # and sorted (value, id) lists for the range fields. A query turns each
+    # predicate into a Python int and ANDs them; a facet count is the popcount
+    # of the filtered set ANDed with one value's bitmap.
+    CATEGORIES = ('genre', 'read', 'rating')
+    RANGES = ('year', 'date_added')
+    # Batches at least this big are appended and sorted once; inserting
+    # each book shifts the whole list every time, which is quadratic
+    SORT_BATCH = 512
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self._all = bytearray()
+        self._bitmaps = {field: {} for field in self.CATEGORIES}
+        self._sorted = {field: [] for field in self.RANGES}
+
+    def rebuild(self, books: Iterable[Dict[str, Any]]) -> None:
+        self.clear()
+        self._extend(books)
+
+    def add_many(self, books: List[Dict[str, Any]]) -> None:
+        if len(books) >= self.SORT_BATCH:
+            self._extend(books)
+            return
+        for book in books:
+            self.add(book)
+
+    def _extend(self, books: Iterable[Dict[str, Any]]) -> None:
+        for book in books:
+            self._add_bits(book)
+            for field in self.RANGES:
+                if book.get(field) is not None:
+                    self._sorted[field].append((book[field], book['id']))
+        # Timsort finds the existing entries already in order and merges
+        # the new ones in
+        for entries in self._sorted.values():
+            entries.sort()
+
+    def add(self, book: Dict[str, Any]) -> None:
+        self._add_bits(book)
+        for field in self.RANGES:
+            if book.get(field) is not None:
+                bisect.insort(self._sorted[field], (book[field], book['id']))
+
+    def remove(self, book: Dict[str, Any]) -> None:
+        key = book['id']
+        _clear_bit(self._all, key)
+        for field in self.CATEGORIES:
+            _clear_bit(self._bitmaps[field][self._value(book, field)], key)
+        for field in self.RANGES:
+            if book.get(field) is not None:
+                entries = self._sorted[field]
+                del entries[bisect.bisect_left(entries, (book[field], key))]
+
+    def everything(self) -> int:
+        return int.from_bytes(self._all, 'little')
+
+    def category(self, field: str, values: Iterable[Any]) -> int:
+        # Books whose `field` is any of `values`
+        bitmaps = self._bitmaps[field]
+        bitmap = 0
+        for value in values:
+            if value in bitmaps:
+                bitmap |= int.from_bytes(bitmaps[value], 'little')
+        return bitmap
+
+    def range(self, field: str, low: Any = None, high: Any = None) -> int:
+        # Books with low <= `field` <= high; either end may be open
+        entries = self._sorted[field]
+        start = 0 if low is None else bisect.bisect_left(entries, (low,))
+        end = len(entries) if high is None else bisect.bisect_left(entries, (high, float('inf')))
+        return _ids_bitmap(key for _, key in entries[start:end])
+
+    def counts(self, field: str, mask: int) -> Dict[Any, int]:
+        counts = {}
+        for value, bits in self._bitmaps[field].items():
+            count = (mask & int.from_bytes(bits, 'little')).bit_count()
+            if count:
+                counts[value] = count
+        return counts
+
+    def bounds(self, field: str) -> Tuple[Any, Any]:
+        entries = self._sorted[field]
+        return (entries[0][0], entries[-1][0]) if entries else (None, None)
+
+    def _add_bits(self, book: Dict[str, Any]) -> None:
+        key = book['id']
+        _set_bit(self._all, key)
+        for field in self.CATEGORIES:
+            value = self._value(book, field)
+            bitmaps = self._bitmaps[field]
+            if value not in bitmaps:
+                bitmaps[value] = bytearray()
+            _set_bit(bitmaps[value], key)
+
+    @staticmethod
+    def _value(book: Dict[str, Any], field: str) -> Any:
+        if field == 'read':
+            return bool(book['read'])
+        if field == 'rating':
+            return book.get('rating') or 0
+        return book[field]
+
+
+class ReadWriteLock:
+    # Many concurrent readers or one writer. Waiting writers hold off new
+    # readers so a steady stream of page renders cannot starve an add/remove.
+    # Re-entrant per thread, and a writer may also read.
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._writers_waiting = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def read(self):
+        me = threading.get_ident()
+        depth = getattr(self._local, 'reads', 0)
+        owns_write = self._writer == me
+        if not owns_write:
+            with self._cond:
+                if not depth:
+                    while self._writer is not None or self._writers_waiting:
+                        self._cond.wait()
+                self._readers += 1
+        self._local.reads = depth + 1
+        try:
+            yield
+        finally:
+            self._local.reads = depth
+            if not owns_write:
+                with self._cond:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me:
+                self._writers_waiting += 1
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._writers_waiting -= 1
+                self._writer = me
+            self._write_depth += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._write_depth -= 1
+                if not self._write_depth:
+                    self._writer = None
+                    self._cond.notify_all()
+
+
+class Metrics:
+    # Opt-in timing histograms and counters for manager methods and page
+    # sections. Off unless LIBRARY_METRICS=1 or switched on from the
+    # diagnostics panel; while off, every hook is a single attribute check.
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+    def start(self) -> float:
+        return time.perf_counter() if self.enabled else None
+
+    def stop(self, name: str, started: float) -> None:
+        if started is not None:
+            self.observe(name, time.perf_counter() - started)
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = {
+                    'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * (len(self.BUCKETS) + 1)
+                }
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+            histogram['max'] = max(histogram['max'], seconds)
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    break
+            else:
+                i = len(self.BUCKETS)
+            histogram['buckets'][i] += 1
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def quantile(self, name: str, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation
+        histogram = self.histograms[name]
+        rank = q * histogram['count']
+        seen = 0
+        for bound, count in zip(self.BUCKETS, histogram['buckets']):
+            seen += count
+            if seen >= rank:
+                return bound
+        return histogram['max']
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'buckets': list(self.BUCKETS),
+                'histograms': {name: dict(h, buckets=list(h['buckets'])) for name, h in self.histograms.items()},
+                'counters': dict(self.counters)
+            }
+
+    def to_prometheus(self) -> str:
+        data = self.snapshot()
+        lines = [
+            "# HELP library_operation_seconds Time spent in library operations and page sections.",
+            "# TYPE library_operation_seconds histogram"
+        ]
+        for name, histogram in sorted(data['histograms'].items()):
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS, histogram['buckets']):
+                cumulative += count
+                lines.append(f'library_operation_seconds_bucket{{operation="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'library_operation_seconds_bucket{{operation="{name}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'library_operation_seconds_sum{{operation="{name}"}} {histogram["sum"]}')
+            lines.append(f'library_operation_seconds_count{{operation="{name}"}} {histogram["count"]}')
+        lines.append("# HELP library_events_total Library event counters.")
+        lines.append("# TYPE library_events_total counter")
+        for name, value in sorted(data['counters'].items()):
+            lines.append(f'library_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+        # .prom/.txt files get the Prometheus text format, anything else JSON
+        if path.endswith(('.prom', '.txt')):
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.to_prometheus())
+        else:
+            _atomic_write_json(path, self.snapshot())
+
+
+metrics = Metrics(enabled=os.environ.get('LIBRARY_METRICS') == '1')
+
+
+def timed(name: str):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+class LRUCache:
+    # Small thread-safe LRU, used for values derived from the library. Keys
+    # include the data version, so entries for old versions just age out.
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: Any, build) -> Any:
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                metrics.incr('cache_hit')
+                return self._items[key]
+        metrics.incr('cache_miss')
+        value = build()
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+class BackgroundWriter:
+    # Runs flush() on a daemon thread, debounced: the first change after a
+    # flush starts the clock, and everything that arrives within `interval`
+    # seconds goes out in the same write. Flushes once more at exit.
+    def __init__(self, flush, interval: float = 1.0):
+        self.interval = interval
+        self.last_error = None
+        self._flush = flush
+        self._wake = threading.Event()
+        self._closing = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='library-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def close(self) -> None:
+        # Stops the thread and writes whatever is still pending
+        if not self._closing.is_set():
+            self._closing.set()
+            self._wake.set()
+            self._thread.join()
+            # The exit hook would keep the manager alive after it is dropped
+            atexit.unregister(self.close)
+        self._flush()
+
+    def _run(self) -> None:
+        # close() may set the wake-up just before it is cleared below, so
+        # the closing flag is checked before every wait
+        while not self._closing.is_set():
+            self._wake.wait()
+            # Let the burst finish; close() cuts the wait short and flushes itself
+            if self._closing.wait(self.interval):
+                return
+            self._wake.clear()
+            try:
+                self._flush()
+                self.last_error = None
+            except Exception as e:
+                # Pending changes stay queued and go out with the next flush
+                self.last_error = e
+                metrics.incr('writer_error')
+                self._wake.set()
+
+
+def _reads(method):
+    # Manager methods are timed as "manager.<name>", lock waits included
+    @timed('manager.' + method.__name__)
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.read():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _indexed(method):
+    # For methods that use the title, search, statistics or facet indexes,
+    # which a lazily loaded library only builds when first needed
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._build_indexes()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _writes(method):
+    # Mutations take the write lock and bump the data version so other
+    # sessions sharing this manager can tell the library changed. They also
+    # hold the storage's file lock and first merge whatever other processes
+    # wrote, so nobody overwrites changes they never saw.
+    @timed('manager.' + method.__name__)
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.write(), self._synced():
+            result = method(self, *args, **kwargs)
+            self.version += 1
+            return result
+    return wrapper
+
+
+def _parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('true', 'yes', 'y', '1', 'read', '✅'):
+        return True
+    if text in ('false', 'no', 'n', '0', '', 'unread', 'not read', '❌'):
+        return False
+    raise ValueError(f"read must be yes/no, got {value!r}")
+
+
+def _parse_int(value: Any, field: str) -> int:
+    if isinstance(value, bool):
+        raise ValueError(f"{field} must be a whole number, got {value!r}")
+    if isinstance(value, int):
+        return value
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{field} must be a whole number, got {value!r}") from None
+
+
+def validate_book(record: Dict[str, Any]) -> Dict[str, Any]:
+    # Turns an imported record (CSV strings or JSON values) into a book dict
+    # shaped like the ones add_book creates, or raises ValueError
+    if not str(record.get('title') or '').strip() or not str(record.get('author') or '').strip():
+        raise ValueError("title and author are required")
+    if record.get('year') in (None, ''):
+        raise ValueError("year is required")
+    return _validate_fields({'title': record['title'], 'author': record['author'], 'year': record['year'],
+                             'genre': record.get('genre'), 'read': record.get('read', False),
+                             'rating': record.get('rating'), 'date_added': record.get('date_added')})
+
+
+def _validate_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    # The checks for just the fields given, as add_book and update_book take
+    # them, so editing one field doesn't re-check the others. Unlike an
+    # import, a book may have no year (None).
+    checked = {}
+    for field, value in fields.items():
+        if field in ('title', 'author'):
+            value = str(value or '').strip()
+            if not value:
+                raise ValueError(f"{field} is required")
+        elif field == 'year':
+            if value in (None, ''):
+                value = None
+            else:
+                value = _parse_int(value, 'year')
+                if not -9999 <= value <= 9999:
+                    raise ValueError(f"year must be between -9999 and 9999, got {value}")
+        elif field == 'genre':
+            value = str(value or '').strip() or 'Other'
+        elif field == 'read':
+            value = _parse_bool(value)
+        elif field == 'rating':
+            value = _parse_int(value or 0, 'rating')
+            if not 0 <= value <= 5:
+                raise ValueError(f"rating must be between 0 and 5, got {value}")
+        elif field == 'date_added':
+            value = str(value or '').strip()
+            if value:
+                try:
+                    valid_date = date.fromisoformat(value).isoformat() == value
+                except ValueError:
+                    valid_date = False
+                if not valid_date:
+                    raise ValueError(f"date_added must be YYYY-MM-DD, got {value!r}")
+            else:
+                value = datetime.now().strftime("%Y-%m-%d")
+        else:
+            raise ValueError(f"Unknown book field: {field}")
+        checked[field] = value
+    return checked
+
+
+def _validate_books(books: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Validate everything up front so one bad record leaves the library untouched
+    new_books = []
+    for number, record in enumerate(books, 1):
+        try:
+            new_books.append(validate_book(record))
+        except ValueError as e:
+            raise ValueError(f"record {number}: {e}") from None
+    return new_books
+
+
+def _iter_catalog(stream, fmt: str) -> Iterator[Tuple[int, Any, str]]:
+    # Yields (row number, record, error) from a binary CSV or JSONL stream,
+    # one line at a time
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(text)
+            if reader.fieldnames:
+                # Accept the Table View headers ("Date Added") as well
+                reader.fieldnames = [name.strip().lower().replace(' ', '_') for name in reader.fieldnames]
+            for row in reader:
+                yield reader.line_num, row, None
+        else:
+            for number, line in enumerate(text, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield number, None, f"invalid JSON: {e}"
+                    continue
+                if isinstance(record, dict):
+                    yield number, record, None
+                else:
+                    yield number, None, "expected a JSON object"
+    finally:
+        # Leave the caller's stream open
+        text.detach()
+
+
+@timed('import_catalog')
+def import_catalog(manager, stream, fmt: str = 'csv', chunk_size: int = 5000,
+                   on_progress=None) -> Tuple[int, List[Tuple[int, str]]]:
+    # Validates a CSV/JSONL upload in chunks, then adds all valid rows with a
+    # single add_books call (one transaction, one write). Returns the number
+    # of books added and the (row, error) pairs that were rejected.
+    valid = []
+    rejected = []
+    rows = 0
+    for number, record, error in _iter_catalog(stream, fmt):
+        rows += 1
+        if error is None:
+            try:
+                valid.append(validate_book(record))
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            rejected.append((number, error))
+        if on_progress is not None and rows % chunk_size == 0:
+            on_progress(rows)
+    if on_progress is not None:
+        on_progress(rows)
+    added = manager.add_books(valid) if valid else 0
+    return added, rejected
+
+
+# Export formats and their MIME types. Parquet needs pyarrow, imported only
+# when a Parquet export runs.
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson', 'parquet': 'application/vnd.apache.parquet'}
+
+
+def _write_export(chunks: Iterable[List[Dict[str, Any]]], stream, fmt: str) -> int:
+    # Writes chunks of books to a binary stream as they arrive, so only one
+    # chunk is in memory at a time; each Parquet chunk is one row group.
+    # The columns match what import_catalog reads back.
+    columns = ('id',) + BOOK_FIELDS
+    count = 0
+    if fmt == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([('id', pa.int64()), ('title', pa.string()), ('author', pa.string()),
+                            ('year', pa.int32()), ('genre', pa.string()), ('read', pa.bool_()),
+                            ('rating', pa.int8()), ('date_added', pa.date32())])
+        with pq.ParquetWriter(stream, schema) as writer:
+            for books in chunks:
+                data = {column: [book.get(column) for book in books] for column in columns}
+                data['date_added'] = [value and date.fromisoformat(value) for value in data['date_added']]
+                writer.write_table(pa.Table.from_pydict(data, schema=schema))
+                count += len(books)
+        return count
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    try:
+        if fmt == 'csv':
+            writer = csv.DictWriter(text, columns, extrasaction='ignore')
+            writer.writeheader()
+            for books in chunks:
+                writer.writerows(books)
+                count += len(books)
+        else:
+            for books in chunks:
+                text.write(''.join(json.dumps(book) + '\n' for book in books))
+                count += len(books)
+        text.flush()
+    finally:
+        # Leave the caller's stream open
+        text.detach()
+    return count
+
+
+class LibraryManager:
+    # Ids reserved at a time when writes are batched, so handing out an id
+    # rarely needs the storage lock
+    ID_BLOCK = 64
+
+    def __init__(self, storage=None, flush_interval: float = 0, lazy: bool = False):
+        self.storage = storage if storage is not None else JSONStorage()
+        self.lock = ReadWriteLock()
+        self.version = 0
+        # Columnar catalog, in library (insertion) order. With `lazy`, a
+        # MappedBookStore over the snapshot file instead, when the storage
+        # supports it, so start-up doesn't read the books.
+        self.lazy = lazy
+        self.store = BookStore()
+        self.next_id = 1
+        self.id_limit = 1
+        # Mutation records not yet written; only used with a background writer
+        self.pending = []
+        self.writer = None
+        self.derived = LRUCache()
+        self.title_index = TitleIndex()
+        self.search_index = TrigramIndex()
+        self.stats = LibraryStats()
+        self.facet_index = FacetIndex()
+        self.growth = GrowthTimeline()
+        # Everything here is updated on add/remove and rebuilt on load. A lazy
+        # load leaves `indexes` empty until _build_indexes() runs.
+        self.all_indexes = [self.title_index, self.search_index, self.stats, self.facet_index, self.growth]
+        self.indexes = self.all_indexes
+        self.index_lock = threading.Lock()
+        self.load_library()
+        # With a flush interval, mutations only touch memory and a background
+        # thread writes them out in batches
+        if flush_interval > 0:
+            self.writer = BackgroundWriter(self.flush, flush_interval)
+
+    @_writes
+    def add_book(self, title: str, author: str, year: int, genre: str, read: bool, rating: int = 0, date_added: str = None) -> int:
+        fields = _validate_fields({'title': title, 'author': author, 'year': year, 'genre': genre, 'read': read,
+                                   'rating': rating, 'date_added': date_added})
+        book = {'id': self._new_id(), **fields}
+        self.store.append(book)
+        for index in self.indexes:
+            index.add(book)
+        self._record([{'op': 'add', 'book': book}])
+        return book['id']
+
+    @_writes
+    def add_books(self, books: Iterable[Dict[str, Any]]) -> int:
+        new_books = _validate_books(books)
+        self._reserve_ids(len(new_books))
+        for book in new_books:
+            book['id'] = self._new_id()
+            self.store.append(book)
+        for index in self.indexes:
+            index.add_many(new_books)
+        self._record([{'op': 'add', 'book': book} for book in new_books])
+        return len(new_books)
+
+    @_writes
+    @_indexed
+    def remove_book(self, title: str) -> bool:
+        # Removes the earliest added book with this title (case-insensitive)
+        book_id = self.title_index.first(title)
+        return book_id is not None and self.remove_book_by_id(book_id)
+
+    @_writes
+    def remove_book_by_id(self, book_id: int) -> bool:
+        book = self.store.remove(book_id)
+        if book is None:
+            return False
+        for index in self.indexes:
+            index.remove(book)
+        self._record([{'op': 'remove', 'id': book_id}])
+        return True
+
+    @_writes
+    def update_book(self, book_id: int, **changes) -> bool:
+        # Edits a book in place; the id and its position in the library stay
+        book = self.store.get(book_id)
+        if book is None:
+            return False
+        unknown = set(changes) - set(BOOK_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown book fields: {', '.join(sorted(unknown))}")
+        updated = {**book, **_validate_fields(changes)}
+        self.store.update(book_id, updated)
+        for index in self.indexes:
+            index.remove(book)
+            index.add(updated)
+        self._record([{'op': 'update', 'book': updated}])
+        return True
+
+    @_reads
+    def get_book(self, book_id: int) -> Dict[str, Any]:
+        return self.store.get(book_id)
+
+    @_reads
+    @_indexed
+    def search_books(self, query: str, fields=('title', 'author')) -> List[Dict[str, Any]]:
+        return self.store.get_many(self.search_index.search_keys(query, fields))
+
+    @_reads
+    @_indexed
+    def search_page(self, query: str, fields=('title', 'author'), page: int = 1, page_size: int = 24) -> Dict[str, Any]:
+        keys = self.search_index.search_keys(query, fields)
+        page, pages, start = _page_bounds(len(keys), page, page_size)
+        books = self.store.get_many(keys[start:start + page_size])
+        return _page(books, len(keys), page, pages, page_size)
+
+    @_reads
+    @_indexed
+    def search_ranked(self, query: str, fields=('title', 'author', 'genre'), limit: int = 20) -> List[Dict[str, Any]]:
+        # Best matches first, typos tolerated; each book carries its 'score'
+        ranked = self.search_index.rank(query, fields, limit)
+        books = self.store.get_many(key for key, _ in ranked)
+        for book, (_, score) in zip(books, ranked):
+            book['score'] = round(score, 3)
+        return books
+
+    @_reads
+    def get_all_books(self) -> List[Dict[str, Any]]:
+        return list(self.store)
+
+    @_reads
+    def get_books_page(self, page: int = 1, page_size: int = 24, sort_by: str = None,
+                       descending: bool = False) -> Dict[str, Any]:
+        # Only the requested slice is turned into book dicts; without sort_by
+        # the library order is used
+        ids = self._sorted_ids(sort_by, descending)
+        page, pages, start = _page_bounds(len(ids), page, page_size)
+        return _page(self.store.get_many(ids[start:start + page_size]), len(ids), page, pages, page_size)
+
+    @_reads
+    @_indexed
+    def query(self, genres: Iterable[str] = None, year_min: int = None, year_max: int = None,
+              read: bool = None, min_rating: int = None, added_from=None, added_to=None,
+              text: str = None, text_fields=('title', 'author'), page: int = 1, page_size: int = 24,
+              sort_by: str = None, descending: bool = False) -> Dict[str, Any]:
+        # Books matching every given filter (`genres` matches any of them), as a
+        # page like get_books_page. 'facets' counts genres, read status and
+        # ratings under all the other filters, i.e. how many books picking that
+        # value would leave; 'year_range' is the library's oldest and newest year.
+        facets = self.facet_index
+        masks = self._filter_masks(genres, year_min, year_max, read, min_rating, added_from, added_to,
+                                   text, text_fields)
+        everything = facets.everything()
+
+        def matching(skip: str = None) -> int:
+            bitmap = everything
+            for name, mask in masks.items():
+                if name != skip:
+                    bitmap &= mask
+            return bitmap
+
+        ids = self._ordered(_bitmap_ids(matching()), sort_by, descending)
+        page, pages, start = _page_bounds(len(ids), page, page_size)
+        result = _page(self.store.get_many(ids[start:start + page_size]), len(ids), page, pages, page_size)
+        result['facets'] = {field: facets.counts(field, matching(field)) for field in FacetIndex.CATEGORIES}
+        result['year_range'] = facets.bounds('year')
+        return result
+
+    @_reads
+    def books_frame(self, ids: Iterable[int] = None, columns=None):
+        # The catalog (or just `ids`) as a pandas DataFrame, built from the
+        # store's columns rather than from book dicts
+        return self.store.to_frame(ids, columns)
+
+    @timed('manager.export')
+    def export(self, stream, fmt: str = 'csv', filters: Dict[str, Any] = None, sort_by: str = None,
+               descending: bool = False, chunk_size: int = 5000) -> int:
+        # Writes the catalog, or the books matching query()'s `filters`, to a
+        # binary stream as CSV, JSONL or Parquet, `chunk_size` books at a
+        # time. The read lock is only held while a chunk is fetched, so
+        # writers aren't blocked for the whole export. Returns the book count.
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        return _write_export(self._export_chunks(filters or {}, sort_by, descending, chunk_size), stream, fmt)
+
+    def _export_chunks(self, filters: Dict[str, Any], sort_by: str, descending: bool,
+                       chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+        with self.lock.read():
+            masks = self._filter_masks(**filters)
+            if masks:
+                bitmap = self.facet_index.everything()
+                for mask in masks.values():
+                    bitmap &= mask
+                ids = self._ordered(_bitmap_ids(bitmap), sort_by, descending)
+            else:
+                ids = self._sorted_ids(sort_by, descending)
+        for start in range(0, len(ids), chunk_size):
+            with self.lock.read():
+                # Books removed since the ids were taken are skipped
+                books = [book for book in map(self.store.get, ids[start:start + chunk_size]) if book is not None]
+            yield books
+
+    def _filter_masks(self, genres: Iterable[str] = None, year_min: int = None, year_max: int = None,
+                      read: bool = None, min_rating: int = None, added_from=None, added_to=None,
+                      text: str = None, text_fields=('title', 'author')) -> Dict[str, int]:
+        # One bitmap per given query() filter
+        given = (genres, min_rating, text, read, year_min, year_max, added_from, added_to)
+        if not any(given[:3]) and all(value is None for value in given[3:]):
+            return {}
+        self._build_indexes()
+        facets = self.facet_index
+        masks = {}
+        if genres:
+            masks['genre'] = facets.category('genre', genres)
+        if read is not None:
+            masks['read'] = facets.category('read', [bool(read)])
+        if min_rating:
+            masks['rating'] = facets.category('rating', range(min_rating, 6))
+        if year_min is not None or year_max is not None:
+            masks['year'] = facets.range('year', year_min, year_max)
+        if added_from is not None or added_to is not None:
+            masks['date_added'] = facets.range('date_added', added_from and str(added_from),
+                                               added_to and str(added_to))
+        if text:
+            masks['text'] = _ids_bitmap(self.search_index.search_keys(text, text_fields))
+        return masks
+
+    def _ordered(self, ids: List[int], sort_by: str, descending: bool) -> List[int]:
+        # `ids` (ascending) in the order get_books_page would list them
+        if sort_by is not None:
+            wanted = set(ids)
+            return [key for key in self._sorted_ids(sort_by, descending) if key in wanted]
+        if descending:
+            ids.reverse()
+        return ids
+
+    def _sorted_ids(self, sort_by: str, descending: bool) -> List[int]:
+        # Sorted orders are cached until the next mutation, so paging through
+        # a sorted library sorts it once
+        if sort_by is not None and sort_by not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key: {sort_by}")
+
+        def build():
+            if sort_by is None:
+                ids = self.store.ids()
+                if descending:
+                    ids.reverse()
+                return ids
+            return self.store.sorted_ids(sort_by, descending)
+
+        return self.cached(('sorted', sort_by, descending), build)
+
+    @_reads
+    def cached(self, name: Any, build) -> Any:
+        # Memoizes build() for the current data version, e.g. chart figures
+        # that only change when the library does
+        return self.derived.get_or_build((name, self.version), build)
+
+    @_reads
+    @_indexed
+    def get_statistics(self, top_authors: Optional[int] = 5) -> Dict[str, Any]:
+        # top_authors=None lists every author
+        return self.stats.summary(top_authors)
+
+    @_reads
+    @_indexed
+    def get_growth_timeline(self, resolution: str = 'day') -> Dict[str, List[Any]]:
+        # Books added per day, month or year ('periods', 'added') and the
+        # library size after each ('total'), for books with a date_added
+        return self.growth.series(resolution)
+
+    @_writes
+    def save_library(self) -> None:
+        # A full snapshot, written now; pending changes are part of it
+        with self.storage.lock():
+            if self.writer is not None:
+                self._merge_changes()
+            self.pending = []
+            self.storage.save(self.store)
+
+    @timed('manager.flush')
+    def flush(self) -> None:
+        # Writes pending changes now, after merging what other processes
+        # wrote. The background writer calls this; so can shutdown code.
+        with self.lock.write(), self.storage.lock():
+            self._merge_changes()
+            if not self.pending:
+                return
+            records, self.pending = self.pending, []
+            try:
+                self.storage.record(records, self.store)
+            except BaseException:
+                self.pending = records + self.pending
+                raise
+
+    def close(self) -> None:
+        # Flushes and stops the background writer; changes made afterwards
+        # are written straight away
+        if self.writer is not None:
+            self.writer.close()
+            with self.lock.write():
+                self.writer = None
+            self.flush()
+
+    def memory_usage(self) -> int:
+        # Estimated bytes held by the catalog and, once built, its indexes
+        return self.store.nbytes() + (len(self.store) * INDEX_BYTES_PER_BOOK if self.indexes else 0)
+
+    @_writes
+    def load_library(self) -> None:
+        # One hold of the file lock throughout, so nobody can write between
+        # reading the books and saving the ids given to books without one
+        with self.storage.lock():
+            self._load_library()
+
+    def _load_library(self) -> None:
+        store = self.storage.open_mapped() if self.lazy else None
+        if store is not None:
+            self.store = store
+            self.indexes = []
+            self.next_id = self.id_limit = store.max_id() + 1
+            for record in self.pending:
+                self._apply_change(record)
+            return
+        books = self.storage.load()
+        self.next_id = max((book['id'] for book in books if 'id' in book), default=0) + 1
+        self.id_limit = self.next_id
+        # Books saved before ids existed get one now, persisted right away
+        missing_ids = False
+        for book in books:
+            if 'id' not in book:
+                book['id'] = self._new_id()
+                missing_ids = True
+        self.store = BookStore()
+        for book in books:
+            self.store.append(book)
+        self.indexes = self.all_indexes
+        for index in self.indexes:
+            index.rebuild(books)
+        if missing_ids:
+            self.storage.save(self.store)
+        # Changes not written yet are still ours
+        for record in self.pending:
+            self._apply_change(record)
+
+    def _build_indexes(self) -> None:
+        # Reads every book once; readers may get here concurrently, and
+        # mutations (which hold the write lock) skip indexes not built yet
+        if self.indexes:
+            return
+        with self.index_lock:
+            if not self.indexes:
+                books = list(self.store)
+                for index in self.all_indexes:
+                    index.rebuild(books)
+                self.indexes = self.all_indexes
+
+    def _new_id(self) -> int:
+        # Like SQLite rowids: one past the highest id in use, skipping ids
+        # other processes have handed out but maybe not written yet
+        self._reserve_ids(1)
+        book_id = self.next_id
+        self.next_id += 1
+        return book_id
+
+    def _reserve_ids(self, count: int) -> None:
+        if self.id_limit - self.next_id >= count:
+            return
+        block = max(count, self.ID_BLOCK if self.writer is not None else 1)
+        self.next_id = self.storage.reserve_ids(self.next_id, block)
+        self.id_limit = self.next_id + block
+
+    def _record(self, records: List[Dict[str, Any]]) -> None:
+        if self.writer is None:
+            self.storage.record(records, self.store)
+        else:
+            self.pending.extend(records)
+            self.writer.notify()
+
+    @timed('manager.refresh')
+    def refresh(self) -> bool:
+        # Picks up changes other processes made to the library files. When
+        # nothing changed this is a stat and a tiny read, cheap enough to call
+        # on every rerun.
+        if not self.storage.changed():
+            return False
+        with self.lock.write(), self.storage.lock():
+            return self._merge_changes()
+
+    @contextmanager
+    def _synced(self):
+        # With a background writer the flush merges instead, so mutations
+        # never wait on the storage lock
+        if self.writer is not None:
+            yield
+            return
+        with self.storage.lock() as outermost:
+            if outermost:
+                self._merge_changes()
+            yield
+
+    def _merge_changes(self) -> bool:
+        # Called with the write lock and the storage lock held. Appended log
+        # records are applied one by one; anything else means a full reload.
+        if not self.storage.changed():
+            return False
+        records = self.storage.read_changes()
+        if records is None:
+            self.load_library()
+        else:
+            for record in records:
+                self._apply_change(record)
+        self.version += 1
+        return True
+
+    def _apply_change(self, record: Dict[str, Any]) -> None:
+        op = record['op']
+        if op == 'remove':
+            if 'id' not in record:
+                self._build_indexes()
+            book_id = record['id'] if 'id' in record else self.title_index.first(record['title'])
+            book = self.store.remove(book_id) if book_id is not None else None
+            if book is not None:
+                for index in self.indexes:
+                    index.remove(book)
+            return
+        book = record['book']
+        old = self.store.get(book['id'])
+        if old is None:
+            self.store.append(book)
+            self.next_id = max(self.next_id, book['id'] + 1)
+        else:
+            self.store.update(book['id'], book)
+        for index in self.indexes:
+            if old is not None:
+                index.remove(old)
+            index.add(book)
+
+class SQLiteLibraryManager(LibraryManager):
+    # Same API as LibraryManager, but the catalog lives in an indexed SQLite
+    # table instead of an in-memory list, so lookups, search and statistics
+    # are SQL queries and memory use does not grow with the catalog
+    COLUMNS = BOOK_FIELDS
+
+    def __init__(self, path: str = 'library.db', fsync: bool = True):
+        self.path = path
+        self.lock = ReadWriteLock()
+        self.version = 0
+        self.derived = LRUCache()
+        # Commits go straight to SQLite; there is no background writer
+        self.writer = None
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # FULL syncs the WAL on every commit; NORMAL stays consistent after a
+        # crash but may lose the last commits on power loss
+        self.conn.execute(f"PRAGMA synchronous={'FULL' if fsync else 'NORMAL'}")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS books (
+                id INTEGER PRIMARY KEY,
+                title TEXT NOT NULL,
+                author TEXT NOT NULL,
+                year INTEGER,
+                genre TEXT,
+                read INTEGER NOT NULL DEFAULT 0,
+                rating INTEGER NOT NULL DEFAULT 0,
+                date_added TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_books_title ON books(title COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS idx_books_author ON books(author);
+            CREATE INDEX IF NOT EXISTS idx_books_genre ON books(genre);
+            CREATE INDEX IF NOT EXISTS idx_books_year ON books(year);
+            CREATE INDEX IF NOT EXISTS idx_books_read ON books(read);
+            CREATE INDEX IF NOT EXISTS idx_books_date_added ON books(date_added);
+        """)
+        self.data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        # In-memory trigram index for search_ranked, built on first use and
+        # then kept up to date by this manager's writes; dropped when another
+        # connection commits
+        self.search_index = None
+        self.index_lock = threading.Lock()
+
+    @_writes
+    def add_book(self, title: str, author: str, year: int, genre: str, read: bool, rating: int = 0, date_added: str = None) -> int:
+        book = _validate_fields({'title': title, 'author': author, 'year': year, 'genre': genre, 'read': read,
+                                 'rating': rating, 'date_added': date_added})
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO books (title, author, year, genre, read, rating, date_added) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                tuple(book[column] for column in self.COLUMNS)
+            )
+        if self.search_index is not None:
+            self.search_index.add({**book, 'id': cur.lastrowid})
+        return cur.lastrowid
+
+    @_writes
+    def add_books(self, books: Iterable[Dict[str, Any]]) -> int:
+        new_books = _validate_books(books)
+        with self.conn:
+            last_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM books").fetchone()[0]
+            self.conn.executemany(
+                "INSERT INTO books (title, author, year, genre, read, rating, date_added) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [tuple(book[column] for column in self.COLUMNS) for book in new_books]
+            )
+            if self.search_index is not None:
+                # New rows get ids past the largest one
+                self._index_rows(self.search_index, "WHERE id > ?", (last_id,))
+        return len(new_books)
+
+    @_writes
+    def remove_book(self, title: str) -> bool:
+        row = self.conn.execute(
+            "SELECT id FROM books WHERE title = ? COLLATE NOCASE ORDER BY id LIMIT 1", (title,)
+        ).fetchone()
+        return row is not None and self.remove_book_by_id(row[0])
+
+    @_writes
+    def remove_book_by_id(self, book_id: int) -> bool:
+        with self.conn:
+            cur = self.conn.execute("DELETE FROM books WHERE id = ?", (book_id,))
+        if cur.rowcount > 0 and self.search_index is not None:
+            self.search_index.remove({'id': book_id})
+        return cur.rowcount > 0
+
+    @_writes
+    def update_book(self, book_id: int, **changes) -> bool:
+        book = self.get_book(book_id)
+        if book is None:
+            return False
+        unknown = set(changes) - set(BOOK_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown book fields: {', '.join(sorted(unknown))}")
+        updated = {**book, **_validate_fields(changes)}
+        assignments = ", ".join(f"{column} = ?" for column in self.COLUMNS)
+        with self.conn:
+            self.conn.execute(
+                f"UPDATE books SET {assignments} WHERE id = ?",
+                tuple(updated[column] for column in self.COLUMNS) + (book_id,)
+            )
+        if self.search_index is not None:
+            self.search_index.remove(book)
+            self.search_index.add({**updated, 'id': book_id})
+        return True
+
+    @_reads
+    def get_book(self, book_id: int) -> Dict[str, Any]:
+        books = self._select("WHERE id = ?", (book_id,))
+        return books[0] if books else None
+
+    @_reads
+    def search_books(self, query: str, fields=('title', 'author')) -> List[Dict[str, Any]]:
+        where, params = self._search_clause(query, fields)
+        if where is None:
+            return []
+        return self._select(f"WHERE {where} ORDER BY id", params)
+
+    @_reads
+    def search_page(self, query: str, fields=('title', 'author'), page: int = 1, page_size: int = 24) -> Dict[str, Any]:
+        where, params = self._search_clause(query, fields)
+        if where is None:
+            return _page([], 0, 1, 1, page_size)
+        total = self.conn.execute(f"SELECT COUNT(*) FROM books WHERE {where}", params).fetchone()[0]
+        page, pages, start = _page_bounds(total, page, page_size)
+        books = self._select(f"WHERE {where} ORDER BY id LIMIT ? OFFSET ?", params + (page_size, start))
+        return _page(books, total, page, pages, page_size)
+
+    @_reads
+    def search_ranked(self, query: str, fields=('title', 'author', 'genre'), limit: int = 20) -> List[Dict[str, Any]]:
+        # SQL has no edit distance, so ranking runs on an in-memory trigram
+        # index of title/author/genre
+        ranked = self._search_index().rank(query, fields, limit)
+        if not ranked:
+            return []
+        ids = [key for key, _ in ranked]
+        books = {book['id']: book for book in self._select(f"WHERE id IN ({', '.join('?' * len(ids))})", tuple(ids))}
+        results = []
+        for key, score in ranked:
+            book = books[key]
+            book['score'] = round(score, 3)
+            results.append(book)
+        return results
+
+    def _search_index(self) -> 'TrigramIndex':
+        # Readers may get here concurrently; writers hold the write lock
+        if self.search_index is None:
+            with self.index_lock:
+                if self.search_index is None:
+                    index = TrigramIndex()
+                    self._index_rows(index)
+                    self.search_index = index
+        return self.search_index
+
+    def _index_rows(self, index: 'TrigramIndex', clause: str = "", params: tuple = ()) -> None:
+        for book_id, title, author, genre in self.conn.execute(
+                "SELECT id, title, author, genre FROM books " + clause, params):
+            index.add({'id': book_id, 'title': title, 'author': author, 'genre': genre})
+
+    @_reads
+    def get_all_books(self) -> List[Dict[str, Any]]:
+        return self._select("ORDER BY id")
+
+    @_reads
+    def get_books_page(self, page: int = 1, page_size: int = 24, sort_by: str = None,
+                       descending: bool = False) -> Dict[str, Any]:
+        order = self._order_clause(sort_by, descending)
+        total = self.conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+        page, pages, start = _page_bounds(total, page, page_size)
+        books = self._select(f"ORDER BY {order} LIMIT ? OFFSET ?", (page_size, start))
+        return _page(books, total, page, pages, page_size)
+
+    @_reads
+    def query(self, genres: Iterable[str] = None, year_min: int = None, year_max: int = None,
+              read: bool = None, min_rating: int = None, added_from=None, added_to=None,
+              text: str = None, text_fields=('title', 'author'), page: int = 1, page_size: int = 24,
+              sort_by: str = None, descending: bool = False) -> Dict[str, Any]:
+        # Each filter is a WHERE condition on an indexed column; facets are
+        # GROUP BY counts with that facet's own condition left out
+        conditions = self._filter_conditions(genres, year_min, year_max, read, min_rating, added_from, added_to,
+                                             text, text_fields)
+
+        def where(skip: str = None) -> Tuple[str, tuple]:
+            return self._where({name: part for name, part in conditions.items() if name != skip})
+
+        clause, params = where()
+        total = self.conn.execute(f"SELECT COUNT(*) FROM books {clause}", params).fetchone()[0]
+        page, pages, start = _page_bounds(total, page, page_size)
+        books = self._select(f"{clause} ORDER BY {self._order_clause(sort_by, descending)} LIMIT ? OFFSET ?",
+                             params + (page_size, start))
+        result = _page(books, total, page, pages, page_size)
+        result['facets'] = {}
+        for field in FacetIndex.CATEGORIES:
+            clause, params = where(field)
+            rows = self.conn.execute(
+                f"SELECT {field}, COUNT(*) FROM books {clause} GROUP BY {field} ORDER BY MIN(id)", params
+            ).fetchall()
+            result['facets'][field] = {bool(value) if field == 'read' else value: count for value, count in rows}
+        result['year_range'] = tuple(self.conn.execute("SELECT MIN(year), MAX(year) FROM books").fetchone())
+        return result
+
+    def _filter_conditions(self, genres: Iterable[str] = None, year_min: int = None, year_max: int = None,
+                           read: bool = None, min_rating: int = None, added_from=None, added_to=None,
+                           text: str = None, text_fields=('title', 'author')) -> Dict[str, Tuple[str, tuple]]:
+        # One WHERE condition per given query() filter
+        conditions = {}
+        if genres:
+            genres = list(genres)
+            conditions['genre'] = (f"genre IN ({', '.join('?' * len(genres))})", tuple(genres))
+        if read is not None:
+            conditions['read'] = ("read = ?", (int(bool(read)),))
+        if min_rating:
+            conditions['rating'] = ("rating >= ?", (min_rating,))
+        if year_min is not None:
+            conditions['year_min'] = ("year >= ?", (year_min,))
+        if year_max is not None:
+            conditions['year_max'] = ("year <= ?", (year_max,))
+        if added_from is not None:
+            conditions['added_from'] = ("date_added >= ?", (str(added_from),))
+        if added_to is not None:
+            conditions['added_to'] = ("date_added <= ?", (str(added_to),))
+        if text:
+            where, params = self._search_clause(text, text_fields)
+            conditions['text'] = (where, params) if where is not None else ("0", ())
+        return conditions
+
+    @staticmethod
+    def _where(conditions: Dict[str, Tuple[str, tuple]]) -> Tuple[str, tuple]:
+        if not conditions:
+            return "", ()
+        parts = conditions.values()
+        return "WHERE " + " AND ".join(sql for sql, _ in parts), sum((params for _, params in parts), ())
+
+    def _export_chunks(self, filters: Dict[str, Any], sort_by: str, descending: bool,
+                       chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+        clause, params = self._where(self._filter_conditions(**filters))
+        with self.lock.read():
+            ids = [row[0] for row in self.conn.execute(
+                f"SELECT id FROM books {clause} ORDER BY {self._order_clause(sort_by, descending)}", params)]
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            with self.lock.read():
+                books = {book['id']: book for book in
+                         self._select(f"WHERE id IN ({', '.join('?' * len(chunk))})", tuple(chunk))}
+            yield [books[book_id] for book_id in chunk if book_id in books]
+
+    def _order_clause(self, sort_by: str, descending: bool) -> str:
+        direction = "DESC" if descending else "ASC"
+        if sort_by is None:
+            return f"id {direction}"
+        if sort_by in SORT_KEYS:
+            collate = " COLLATE NOCASE" if sort_by in ('title', 'author', 'genre') else ""
+            return f"{sort_by}{collate} {direction}, id"
+        raise ValueError(f"Unknown sort key: {sort_by}")
+
+    @_reads
+    def books_frame(self, ids: Iterable[int] = None, columns=None):
+        columns = list(columns or ('id',) + BOOK_FIELDS)
+        unknown = set(columns) - {'id', *self.COLUMNS}
+        if unknown:
+            raise ValueError(f"Unknown column: {', '.join(sorted(unknown))}")
+        query = f"SELECT id, {', '.join(c for c in columns if c != 'id')} FROM books"
+        params = ()
+        if ids is not None:
+            ids = list(ids)
+            query += f" WHERE id IN ({', '.join('?' * len(ids))})" if ids else " WHERE 0"
+            params = tuple(ids)
+        import pandas as pd
+
+        frame = pd.read_sql_query(query + " ORDER BY id", self.conn, params=params, index_col='id')
+        if ids is not None:
+            frame = frame.reindex(ids)
+        frame = frame.reset_index()
+        if 'read' in frame:
+            frame['read'] = frame['read'].astype(bool)
+        if 'date_added' in frame:
+            frame['date_added'] = pd.to_datetime(frame['date_added'])
+        return frame[columns]
+
+    @_reads
+    def get_statistics(self, top_authors: Optional[int] = 5) -> Dict[str, Any]:
+        total_books, read_books = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(read), 0) FROM books"
+        ).fetchone()
+        percent_read = (read_books / total_books * 100) if total_books > 0 else 0
+
+        # Genres, and authors with equal counts, come in order of their
+        # earliest book. LibraryManager lists genres the same way (until
+        # removals reorder them), but its TopCounter puts the author who
+        # reached a count first ahead on a tie, so tied authors can come
+        # out in a different order there
+        genres = dict(self.conn.execute(
+            "SELECT genre, COUNT(*) FROM books GROUP BY genre ORDER BY MIN(id)"
+        ).fetchall())
+        top_authors = dict(self.conn.execute(
+            "SELECT author, COUNT(*) AS n FROM books GROUP BY author ORDER BY n DESC, MIN(id) LIMIT ?",
+            (-1 if top_authors is None else top_authors,)
+        ).fetchall())
+
+        return {
+            'total_books': total_books,
+            'read_books': read_books,
+            'percent_read': round(percent_read, 2),
+            'genres': genres,
+            'top_authors': top_authors
+        }
+
+    @_reads
+    def get_growth_timeline(self, resolution: str = 'day') -> Dict[str, List[Any]]:
+        # One GROUP BY over the date_added index, cached until the data changes
+        if resolution not in GROWTH_RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        width = {'day': 10, 'month': 7, 'year': 4}[resolution]
+
+        def build():
+            rows = self.conn.execute(
+                f"SELECT substr(date_added, 1, {width}) AS period, COUNT(*) FROM books "
+                f"WHERE date_added IS NOT NULL AND date_added != '' GROUP BY period ORDER BY period"
+            ).fetchall()
+            return _growth_series([period for period, _ in rows], [count for _, count in rows])
+
+        return self.cached(('growth', resolution), build)
+
+    @_writes
+    def save_library(self) -> None:
+        self.conn.commit()
+
+    def load_library(self) -> None:
+        # Nothing to load: every query reads straight from the database
+        pass
+
+    def refresh(self) -> bool:
+        # SQLite locks the database across processes itself; data_version
+        # changes whenever another connection commits, which is all the
+        # derived caches need to know
+        with self.lock.read():
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return False
+        with self.lock.write():
+            self.data_version = data_version
+            self.version += 1
+            self.search_index = None
+        return True
+
+    def _synced(self):
+        return nullcontext()
+
+    def flush(self) -> None:
+        # Every call already commits
+        pass
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def memory_usage(self) -> int:
+        # The books stay on disk; what is held is SQLite's page cache and,
+        # once ranked search has built it, the search index
+        page_size, page_count, cache_size = (self.conn.execute(f"PRAGMA {name}").fetchone()[0]
+                                             for name in ('page_size', 'page_count', 'cache_size'))
+        # A negative cache_size is in KiB, a positive one in pages
+        cache_bytes = -cache_size * 1024 if cache_size < 0 else cache_size * page_size
+        indexed = len(self.search_index or ())
+        return min(page_size * page_count, cache_bytes) + indexed * SEARCH_INDEX_BYTES_PER_BOOK
+
+    @_writes
+    def import_json(self, path: str = 'library.json') -> int:
+        # One-shot migration of a library.json (plain list or journal snapshot
+        # plus log) into the database, in a single transaction. Book ids are
+        # kept; books without one get a new rowid.
+        books = JournalStorage(path).load() if os.path.exists(path + '.log') else JSONStorage(path).load()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO books (id, title, author, year, genre, read, rating, date_added) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(b.get('id'), b['title'], b['author'], b.get('year'), b.get('genre'), bool(b.get('read')),
+                  b.get('rating', 0), b.get('date_added')) for b in books]
+            )
+        self.search_index = None
+        return len(books)
+
+    def _search_clause(self, query: str, fields) -> Tuple[str, tuple]:
+        fields = [field for field in TrigramIndex.FIELDS if field in fields]
+        if not fields:
+            return None, ()
+        pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        where = " OR ".join(f"{field} LIKE ? ESCAPE '\\'" for field in fields)
+        return f"({where})", (pattern,) * len(fields)
+
+    def _select(self, clause: str = "", params: tuple = ()) -> List[Dict[str, Any]]:
+        rows = self.conn.execute(
+            "SELECT id, title, author, year, genre, read, rating, date_added FROM books " + clause, params
+        )
+        return [self._row_to_book(row) for row in rows]
+
+    def _row_to_book(self, row: tuple) -> Dict[str, Any]:
+        book = dict(zip(('id',) + self.COLUMNS, row))
+        book['read'] = bool(book['read'])
+        if book['date_added'] is None:
+            del book['date_added']
+        return book
+
+
+LIBRARY_ID = re.compile(r'[A-Za-z0-9][A-Za-z0-9_-]{0,63}')
+
+
+def library_directory(library_id: str, root: str = None) -> str:
+    # Each library id gets its own directory, under `root` or else
+    # LIBRARY_ROOT (default "libraries"), holding the usual library files
+    if not LIBRARY_ID.fullmatch(library_id):
+        raise ValueError(f"Library ids are 1-64 letters, digits, '-' or '_', not {library_id!r}")
+    return os.path.join(root or os.environ.get('LIBRARY_ROOT', 'libraries'), library_id)
+
+
+def create_library_manager(backend: str = None, flush_interval: float = None, lazy: bool = None,
+                           library_id: str = None, root: str = None) -> LibraryManager:
+    # `backend`, or else LIBRARY_BACKEND, picks the storage engine: "journal"
+    # (default), "json" or "sqlite". The first SQLite start migrates an
+    # existing library.json.
+    # LIBRARY_DURABILITY is "fsync" (default: every write reaches the disk
+    # before it counts as done) or "best-effort" (left to the OS).
+    # `flush_interval`, or else LIBRARY_FLUSH_INTERVAL (default 0.5 seconds),
+    # batches changes into background writes; 0 writes each change at once.
+    # `lazy`, or else LIBRARY_LOAD=lazy (default: eager), maps the journal
+    # snapshot instead of reading it; see MappedBookStore.
+    # Without `library_id` the library lives in the working directory;
+    # with one, in library_directory(library_id, root).
+    backend = backend or os.environ.get('LIBRARY_BACKEND', 'journal')
+    durability = os.environ.get('LIBRARY_DURABILITY', 'fsync')
+    if durability not in ('fsync', 'best-effort'):
+        raise ValueError(f"LIBRARY_DURABILITY must be fsync or best-effort, not {durability!r}")
+    fsync = durability == 'fsync'
+    if flush_interval is None:
+        flush_interval = float(os.environ.get('LIBRARY_FLUSH_INTERVAL', '0.5'))
+    if lazy is None:
+        load = os.environ.get('LIBRARY_LOAD', 'eager')
+        if load not in ('eager', 'lazy'):
+            raise ValueError(f"LIBRARY_LOAD must be eager or lazy, not {load!r}")
+        lazy = load == 'lazy'
+    directory = '' if library_id is None else library_directory(library_id, root)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    json_path = os.path.join(directory, 'library.json')
+    if backend == 'sqlite':
+        db_path = os.path.join(directory, 'library.db')
+        is_new = not os.path.exists(db_path)
+        manager = SQLiteLibraryManager(db_path, fsync)
+        # A journal that never compacted has only its log
+        if is_new and (os.path.exists(json_path) or os.path.exists(json_path + '.log')):
+            manager.import_json(json_path)
+        return manager
+    if backend == 'json':
+        return LibraryManager(JSONStorage(json_path, fsync), flush_interval)
+    return LibraryManager(JournalStorage(json_path, fsync=fsync), flush_interval, lazy)
+
+
+# summary.json holds every author's count, so aggregate_statistics can sum
+# them exactly; summaries in another format are ignored and rebuilt
+SUMMARY_FORMAT = 'library-summary/2'
+
+
+class LibraryPool:
+    # Process-wide LRU of open libraries keyed by library id, for serving
+    # many libraries from one process. A library is opened on first get()
+    # and closed again, least recently used first, once the open ones'
+    # memory_usage() adds up to more than `max_bytes` (or else LIBRARY_CACHE_MB,
+    # default 512). Closing flushes pending writes and saves a small
+    # summary.json, so aggregate_statistics covers closed libraries without
+    # opening them. The library just asked for is never closed, so a single
+    # oversized library still works. Look managers up on each use rather
+    # than keeping them: a closed SQLite manager can't be used again.
+    def __init__(self, max_bytes: int = None, root: str = None, **options):
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get('LIBRARY_CACHE_MB', '512')) * 2 ** 20)
+        self.max_bytes = max_bytes
+        self.root = root
+        # Passed on to create_library_manager: backend, flush_interval, lazy
+        self.options = options
+        self._managers = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, library_id: str) -> LibraryManager:
+        with self._lock:
+            manager = self._managers.get(library_id)
+            if manager is not None:
+                self._managers.move_to_end(library_id)
+                metrics.incr('pool_hit')
+            else:
+                metrics.incr('pool_miss')
+                manager = create_library_manager(library_id=library_id, root=self.root, **self.options)
+                self._managers[library_id] = manager
+            # Libraries grow and build indexes while open, so check every time
+            self._evict()
+            return manager
+
+    def library_ids(self) -> List[str]:
+        # Every library with a directory under the root, open or not
+        root = self.root or os.environ.get('LIBRARY_ROOT', 'libraries')
+        try:
+            names = os.listdir(root)
+        except FileNotFoundError:
+            names = []
+        with self._lock:
+            names = set(names) | set(self._managers)
+        return sorted(name for name in names if LIBRARY_ID.fullmatch(name)
+                      and (name in self._managers or os.path.isdir(os.path.join(root, name))))
+
+    def memory_usage(self) -> int:
+        with self._lock:
+            return sum(manager.memory_usage() for manager in self._managers.values())
+
+    def close(self, library_id: str = None) -> None:
+        # Closes one library, or all of them
+        with self._lock:
+            for key in [library_id] if library_id is not None else list(self._managers):
+                manager = self._managers.pop(key, None)
+                if manager is not None:
+                    self._close(key, manager)
+
+    @timed('pool.aggregate_statistics')
+    def aggregate_statistics(self, library_ids: Iterable[str] = None, top_authors: int = 5) -> Dict[str, Any]:
+        # get_statistics() across libraries, summed from per-library
+        # summaries: live ones for open libraries, saved ones for closed
+        # libraries whose files haven't changed since. Only a library with
+        # no usable summary gets opened.
+        total_books = read_books = 0
+        genres = Counter()
+        authors = Counter()
+        libraries = {}
+        for library_id in (self.library_ids() if library_ids is None else library_ids):
+            stats = self._summary(library_id)
+            libraries[library_id] = stats['total_books']
+            total_books += stats['total_books']
+            read_books += stats['read_books']
+            genres.update(stats['genres'])
+            authors.update(stats['top_authors'])
+        percent_read = (read_books / total_books * 100) if total_books > 0 else 0
+        return {
+            'total_books': total_books,
+            'read_books': read_books,
+            'percent_read': round(percent_read, 2),
+            'genres': dict(genres),
+            'top_authors': dict(authors.most_common(top_authors)),
+            'libraries': libraries
+        }
+
+    def _evict(self) -> None:
+        usage = {key: manager.memory_usage() for key, manager in self._managers.items()}
+        total = sum(usage.values())
+        while total > self.max_bytes and len(self._managers) > 1:
+            key, manager = self._managers.popitem(last=False)
+            total -= usage[key]
+            metrics.incr('pool_evict')
+            self._close(key, manager)
+
+    def _close(self, library_id: str, manager: LibraryManager) -> None:
+        # The summary is taken once pending writes are out, so it matches the
+        # files, and before close() (a closed SQLite manager can't answer)
+        manager.flush()
+        stats = manager.get_statistics(None)
+        manager.close()
+        summary = {'format': SUMMARY_FORMAT, 'files': self._file_stats(library_id), 'stats': stats}
+        path = os.path.join(library_directory(library_id, self.root), 'summary.json')
+        _atomic_write_json(path, summary, fsync=False)
+
+    def _summary(self, library_id: str) -> Dict[str, Any]:
+        with self._lock:
+            manager = self._managers.get(library_id)
+        if manager is None:
+            path = os.path.join(library_directory(library_id, self.root), 'summary.json')
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    saved = json.load(f)
+                if saved.get('format') == SUMMARY_FORMAT and saved['files'] == self._file_stats(library_id):
+                    return saved['stats']
+            except (FileNotFoundError, ValueError, KeyError):
+                pass
+            manager = self.get(library_id)
+        else:
+            # Another process may have written to it
+            manager.refresh()
+        return manager.get_statistics(None)
+
+    def _file_stats(self, library_id: str) -> List[Any]:
+        directory = library_directory(library_id, self.root)
+        return [list(_file_stat(os.path.join(directory, name)) or ())
+                for name in ('library.json', 'library.json.log', 'library.db', 'library.db-wal')]
@@ -0,0 +1,36 @@
+import os
+import random
+import sys
+
+import pytest
+
+# The modules sit at the repository root, one level up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from library_core import JSONStorage, JournalStorage, LibraryManager, SQLiteLibraryManager  # noqa: E402
+
+STORAGES = {'journal': JournalStorage, 'json': JSONStorage}
+
+
+@pytest.fixture
+def open_manager():
+    # Opens the library at `path`, without fsync: a 'journal' or 'json'
+    # storage (other options go to the storage) or an 'sqlite' database
+    def open_manager(path, backend='journal', flush_interval=0, lazy=False, **options):
+        if backend == 'sqlite':
+            return SQLiteLibraryManager(path, fsync=False)
+        return LibraryManager(STORAGES[backend](path, fsync=False, **options), flush_interval, lazy)
+    return open_manager
+
+
+@pytest.fixture
+def make_books():
+    # `count` book records, the same ones for the same seed. Titles repeat a
+    # few words to search for, with a comma and quotes for CSV to escape.
+    def make_books(count, seed=0):
+        rng = random.Random(seed)
+        return [{'title': f"{rng.choice(['Dune', 'Emma', 'Ulysses', 'Beloved'])}, \"{i}\"",
+                 'author': f"Author {i % 15}", 'genre': rng.choice(["Fiction", "History", "Poetry"]),
+                 'year': rng.randint(1900, 2020), 'read': rng.random() < 0.5, 'rating': rng.randint(0, 5),
+                 'date_added': f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"} for i in range(count)]
+    return make_books
@@ -0,0 +1,94 @@
+import io
+import json
+
+import pytest
+
+from library_core import BookStore, create_library_manager, import_catalog, validate_book
+
+
+def column_lengths(store):
+    columns = (store._ids, store._titles, store._authors, store._genres, store._years, store._ratings,
+               store._read, store._dates, store._alive)
+    return {len(column) for column in columns}
+
+
+def test_rejected_book_leaves_the_columns_untouched():
+    store = BookStore()
+    store.append({'id': 1, 'title': "Dune", 'author': "Frank Herbert", 'year': 1965, 'genre': "Science Fiction",
+                  'read': True, 'rating': 5, 'date_added': "2024-01-02"})
+    with pytest.raises(ValueError):
+        store.append({'id': 2, 'title': "X", 'author': "Y", 'year': 10 ** 12})
+    with pytest.raises(ValueError):
+        store.append({'id': 3, 'title': "X", 'author': "Y", 'year': 2000, 'rating': 1000})
+    with pytest.raises(ValueError):
+        store.update(1, {'title': "Dune", 'author': "Frank Herbert", 'year': "1965"})
+
+    assert column_lengths(store) == {1}
+    assert len(store) == 1 and 2 not in store and 3 not in store
+    assert store.get(1)['year'] == 1965
+    # The rejected names never made it into the pools either
+    assert store._author_pool.values == ["Frank Herbert"]
+
+
+def test_failed_add_keeps_store_and_indexes_in_step(tmp_path, open_manager):
+    path = str(tmp_path / 'library.json')
+    manager = open_manager(path)
+    manager.add_book("Dune", "Frank Herbert", 1965, "Science Fiction", True, 5)
+    with pytest.raises(ValueError):
+        manager.add_books([{'title': "X", 'author': "Y", 'year': 10 ** 12}])
+    with pytest.raises(ValueError):
+        manager.add_book("X", "Y", 10 ** 12, "Other", False)
+
+    emma = manager.add_book("Emma", "Jane Austen", 1815, "Fiction", False, 4)
+    book = manager.get_book(emma)
+    assert (book['title'], book['year'], book['rating']) == ("Emma", 1815, 4)
+    assert [book['title'] for book in manager.get_all_books()] == ["Dune", "Emma"]
+    assert [book['title'] for book in manager.search_ranked("emma")] == ["Emma"]
+    assert manager.get_statistics()['total_books'] == 2
+    assert open_manager(path).get_all_books() == manager.get_all_books()
+
+
+def test_out_of_range_years_are_rejected_on_import(tmp_path, open_manager):
+    # A lazily loaded library must not accept what an eager load can't read
+    path = str(tmp_path / 'library.json')
+    manager = open_manager(path, lazy=True)
+    catalog = b"title,author,year\nDune,Frank Herbert,1965\nX,Y,99999999999\n"
+    added, rejected = import_catalog(manager, io.BytesIO(catalog), 'csv')
+    assert added == 1
+    assert [row for row, _ in rejected] == [3]
+    with pytest.raises(ValueError):
+        manager.add_book("X", "Y", 10 ** 12, "Other", False)
+
+    assert [book['title'] for book in open_manager(path).get_all_books()] == ["Dune"]
+
+
+def test_validate_book_bounds_the_year():
+    assert validate_book({'title': "The Iliad", 'author': "Homer", 'year': "-750"})['year'] == -750
+    with pytest.raises(ValueError, match="year"):
+        validate_book({'title': "X", 'author': "Y", 'year': 99999999999})
+
+
+@pytest.mark.parametrize('backend', ['journal', 'sqlite'])
+def test_update_checks_only_the_changed_fields(tmp_path, monkeypatch, backend):
+    # Saved before add_book checked anything: no year and a rating of 9
+    monkeypatch.setenv('LIBRARY_DURABILITY', 'best-effort')
+    (tmp_path / 'library.json').write_text(json.dumps([
+        {'id': 1, 'title': "Beowulf", 'author': "Unknown", 'year': None, 'genre': "Poetry", 'read': False,
+         'rating': 9, 'date_added': "2024-01-02"}]))
+    monkeypatch.chdir(tmp_path)
+    manager = create_library_manager(backend, flush_interval=0)
+
+    assert manager.update_book(1, rating=1, read="yes")
+    assert manager.get_book(1) == {'id': 1, 'title': "Beowulf", 'author': "Unknown", 'year': None,
+                                   'genre': "Poetry", 'read': True, 'rating': 1, 'date_added': "2024-01-02"}
+    for changes in ({'year': "soon"}, {'rating': 9}, {'title': " "}, {'date_added': "02/01/2024"}):
+        with pytest.raises(ValueError):
+            manager.update_book(1, **changes)
+    # add_book takes the same rules, missing year included
+    with pytest.raises(ValueError, match="rating"):
+        manager.add_book("X", "Y", 2000, "Other", False, 9)
+    book_id = manager.add_book(" Grendel ", "John Gardner", None, "", "no")
+    assert manager.get_book(book_id)['title'] == "Grendel"
+    assert manager.get_book(book_id)['genre'] == "Other"
+    assert manager.get_book(1)['rating'] == 1
+    manager.close()
@@ -0,0 +1,21 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip('streamlit')
+
+import library_app
+from library_core import metrics
+
+
+def test_metrics_dump_goes_to_the_server_chosen_directory(tmp_path, monkeypatch):
+    monkeypatch.setenv('LIBRARY_METRICS_DIR', str(tmp_path / 'metrics'))
+    paths = {fmt: library_app.metrics_dump_path(extension) for fmt, extension in library_app.METRICS_FORMATS.items()}
+    assert paths == {"JSON": str(tmp_path / 'metrics' / 'library_metrics.json'),
+                     "Prometheus": str(tmp_path / 'metrics' / 'library_metrics.prom')}
+
+    metrics.dump(paths["JSON"])
+    with open(paths["JSON"], encoding='utf-8') as f:
+        assert set(json.load(f)) >= {'counters', 'histograms'}
+    assert os.listdir(tmp_path) == ['metrics']
@@ -0,0 +1,54 @@
+import sys
+
+import pytest
+
+pytest.importorskip('streamlit')
+
+from streamlit.testing.v1 import AppTest
+
+
+def library_page(path):
+    # The My Library filter round trip: filters from the previous run's
+    # widgets, the query, then the widgets for the next run. AppTest runs
+    # this as a script of its own, so it can't use the fixtures.
+    import streamlit as st
+
+    import library_app
+    from library_core import JournalStorage, LibraryManager
+
+    manager = LibraryManager(JournalStorage(path, fsync=False))
+    filters = library_app.library_filters()
+    page = manager.query(**filters, page_size=100)
+    library_app.render_library_filters(page)
+    st.session_state['test_filters'] = filters
+    st.session_state['test_total'] = page['total']
+
+
+def test_year_slider_at_the_full_range_filters_nothing(tmp_path, monkeypatch, open_manager):
+    # AppTest runs the page as __main__ and leaves it there, which breaks
+    # later tests that spawn processes
+    monkeypatch.setitem(sys.modules, '__main__', sys.modules['__main__'])
+    path = str(tmp_path / 'library.json')
+    manager = open_manager(path)
+    manager.add_book("Emma", "Jane Austen", 1815, "Classic", False)
+    manager.add_book("Dune", "Frank Herbert", 1965, "Science Fiction", True, 5)
+    manager.add_book("Untitled", "Anonymous", None, "Poetry", False)
+
+    app = AppTest.from_function(library_page, args=(path,)).run()
+    app.run()
+    assert 'year_min' not in app.session_state['test_filters']
+    assert app.session_state['test_total'] == 3
+
+    app.slider(key='filter_years').set_value((1900, 1965)).run()
+    app.run()
+    assert app.session_state['test_filters']['year_min'] == 1900
+    assert app.session_state['test_total'] == 1
+
+    # Back at the ends, the slider follows the library's range as it grows
+    app.slider(key='filter_years').set_value((1815, 1965)).run()
+    manager.add_book("Klara and the Sun", "Kazuo Ishiguro", 2021, "Fiction", False)
+    app.run()
+    app.run()
+    assert app.slider(key='filter_years').value == (1815, 2021)
+    assert 'year_min' not in app.session_state['test_filters']
+    assert app.session_state['test_total'] == 4
@@ -0,0 +1,114 @@
+import json
+import os
+import stat
+
+from library_core import _UMASK
+
+
+def add(manager, title, author="Frank Herbert", year=1965):
+    return manager.add_book(title, author, year, "Science Fiction", False, 3, "2024-01-02")
+
+
+def titles(manager):
+    return [book['title'] for book in manager.get_all_books()]
+
+
+def test_log_is_replayed_on_load(tmp_path, open_manager):
+    path = str(tmp_path / 'library.json')
+    manager = open_manager(path)
+    dune = add(manager, "Dune")
+    messiah = add(manager, "Dune Messiah")
+    add(manager, "Children of Dune")
+    manager.remove_book_by_id(messiah)
+    manager.update_book(dune, rating=5, read=True)
+
+    # Nothing has been compacted yet: the snapshot is missing and the log holds every change
+    assert not os.path.exists(path)
+    with open(path + '.log', encoding='utf-8') as f:
+        assert [json.loads(line)['op'] for line in f] == ['add', 'add', 'add', 'remove', 'update']
+
+    reopened = open_manager(path)
+    assert titles(reopened) == ["Dune", "Children of Dune"]
+    assert reopened.get_book(dune)['rating'] == 5 and reopened.get_book(dune)['read']
+    assert reopened.get_book(messiah) is None
+    assert reopened.get_all_books() == manager.get_all_books()
+
+
+def test_torn_final_line_is_cut_off(tmp_path, open_manager):
+    path = str(tmp_path / 'library.json')
+    manager = open_manager(path)
+    add(manager, "Dune")
+    add(manager, "Dune Messiah")
+    good_size = os.path.getsize(path + '.log')
+    # A crash halfway through an append
+    with open(path + '.log', 'ab') as f:
+        f.write(b'{"op": "add", "book": {"id": 3, "tit')
+
+    reopened = open_manager(path)
+    assert titles(reopened) == ["Dune", "Dune Messiah"]
+    assert os.path.getsize(path + '.log') == good_size
+
+    # The next append starts on a clean line
+    add(reopened, "Children of Dune")
+    assert titles(open_manager(path)) == ["Dune", "Dune Messiah", "Children of Dune"]
+
+
+def test_compaction_folds_the_log_into_the_snapshot(tmp_path, open_manager):
+    path = str(tmp_path / 'library.json')
+    manager = open_manager(path, compact_min_records=5)
+    for number in range(7):
+        add(manager, f"Book {number}")
+    manager.remove_book(manager.get_all_books()[0]['title'])
+
+    assert os.path.exists(path)
+    with open(path + '.log', encoding='utf-8') as f:
+        assert len(f.readlines()) == 3
+    assert titles(open_manager(path)) == [f"Book {number}" for number in range(1, 7)]
+
+
+def test_records_already_in_the_snapshot_are_skipped(tmp_path, open_manager):
+    # A crash between renaming a new snapshot into place and truncating the
+    # log leaves records the snapshot already contains
+    path = str(tmp_path / 'library.json')
+    manager = open_manager(path)
+    dune = add(manager, "Dune")
+    add(manager, "Dune Messiah")
+    manager.save_library()
+    with open(path + '.log', 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'op': 'remove', 'id': dune, 'seq': 1}) + '\n')
+        book = {'id': 3, 'title': "Children of Dune", 'author': "Frank Herbert", 'year': 1976,
+                'genre': "Science Fiction", 'read': False, 'rating': 0, 'date_added': "2024-01-03"}
+        f.write(json.dumps({'op': 'add', 'book': book, 'seq': 3}) + '\n')
+
+    reopened = open_manager(path)
+    assert titles(reopened) == ["Dune", "Dune Messiah", "Children of Dune"]
+    assert add(reopened, "God Emperor of Dune") == 4
+
+
+def test_plain_list_library_gets_ids(tmp_path, open_manager):
+    # library.json as the app first wrote it: a JSON list of books without ids
+    path = str(tmp_path / 'library.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump([{'title': "Emma", 'author': "Jane Austen", 'year': 1815, 'genre': "Fiction", 'read': True},
+                   {'title': "Persuasion", 'author': "Jane Austen", 'year': 1817, 'genre': "Fiction",
+                    'read': False}], f)
+
+    manager = open_manager(path)
+    assert [(book['id'], book['title']) for book in manager.get_all_books()] == [(1, "Emma"), (2, "Persuasion")]
+    # The ids were saved straight away
+    assert [book['id'] for book in open_manager(path).get_all_books()] == [1, 2]
+
+
+def test_snapshots_keep_the_library_file_mode(tmp_path, open_manager):
+    path = str(tmp_path / 'library.json')
+    manager = open_manager(path)
+    manager.add_book("Dune", "Frank Herbert", 1965, "Science Fiction", True, 5)
+    manager.save_library()
+    new_file_mode = 0o666 & ~_UMASK
+    assert stat.S_IMODE(os.stat(path).st_mode) == new_file_mode
+    assert stat.S_IMODE(os.stat(path + '.idx').st_mode) == new_file_mode
+
+    os.chmod(path, 0o640)
+    manager.add_book("Emma", "Jane Austen", 1815, "Classic", False)
+    manager.save_library()
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
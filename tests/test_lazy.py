@@ -0,0 +1,78 @@
+import os
+import shutil
+
+import pytest
+
+from library_core import SORT_KEYS, MappedBookStore
+
+
+def assert_same(lazy, eager):
+    assert lazy.get_all_books() == eager.get_all_books()
+    for sort_by in (None,) + SORT_KEYS:
+        for descending in (False, True):
+            assert (lazy.get_books_page(1, 500, sort_by, descending) ==
+                    eager.get_books_page(1, 500, sort_by, descending))
+    for book in eager.get_all_books()[::7]:
+        assert lazy.get_book(book['id']) == eager.get_book(book['id'])
+    for query in ("dune", "author 3", "ulyses"):
+        assert lazy.search_books(query) == eager.search_books(query)
+        assert lazy.search_ranked(query) == eager.search_ranked(query)
+    for filters in ({}, {'genres': ["Poetry"], 'year_min': 1950}, {'read': False, 'min_rating': 2}):
+        assert lazy.query(page_size=500, sort_by='title', **filters) == eager.query(page_size=500, sort_by='title', **filters)
+    assert lazy.get_statistics(10) == eager.get_statistics(10)
+    assert lazy.get_growth_timeline('month') == eager.get_growth_timeline('month')
+
+
+@pytest.fixture
+def library(tmp_path, open_manager, make_books):
+    # A snapshot, plus a log of adds, removes and updates not compacted into it
+    path = str(tmp_path / 'library.json')
+    manager = open_manager(path, lazy=False)
+    manager.add_books(make_books(120, 1))
+    manager.save_library()
+    for book in make_books(10, 2):
+        manager.add_book(**book)
+    books = manager.get_all_books()
+    for book in books[::9]:
+        manager.remove_book_by_id(book['id'])
+    for book in books[1::11]:
+        manager.update_book(book['id'], title=book['title'] + " (revised)", rating=5, read=True)
+    manager.close()
+    assert os.path.getsize(path + '.log') > 0
+    return path
+
+
+def test_lazy_load_matches_eager(library, open_manager):
+    lazy = open_manager(library, lazy=True)
+    eager = open_manager(library, lazy=False)
+    assert isinstance(lazy.store, MappedBookStore)
+    assert_same(lazy, eager)
+
+
+def copy_library(path, name):
+    copy = os.path.join(os.path.dirname(path), name, 'library.json')
+    os.mkdir(os.path.dirname(copy))
+    for suffix in ('', '.log'):
+        shutil.copy(path + suffix, copy + suffix)
+    return copy
+
+
+def test_lazy_writes_before_and_after_indexing(library, open_manager, make_books):
+    # Each on its own copy, so neither merges the other's writes
+    lazy_path, eager_path = copy_library(library, 'lazy'), copy_library(library, 'eager')
+    lazy = open_manager(lazy_path, lazy=True)
+    eager = open_manager(eager_path, lazy=False)
+    for manager in (lazy, eager):
+        manager.add_books(make_books(5, 3))
+        manager.remove_book_by_id(manager.get_all_books()[2]['id'])
+        manager.update_book(manager.get_all_books()[4]['id'], genre="Poetry", year=1999)
+    # None of that needed the lazy manager's indexes
+    assert not lazy.indexes
+    assert_same(lazy, eager)
+    for manager in (lazy, eager):
+        manager.add_book(**make_books(1, 4)[0])
+        manager.remove_book_by_id(manager.get_all_books()[-3]['id'])
+    assert_same(lazy, eager)
+    lazy.close()
+    eager.close()
+    assert_same(open_manager(lazy_path, lazy=True), open_manager(eager_path, lazy=False))
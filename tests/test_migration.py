@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+from library_core import create_library_manager
+
+
+@pytest.mark.parametrize('snapshot', [False, True])
+def test_sqlite_start_migrates_the_journal(tmp_path, monkeypatch, snapshot):
+    monkeypatch.setenv('LIBRARY_DURABILITY', 'best-effort')
+    journal = create_library_manager('journal', flush_interval=0, library_id='books', root=str(tmp_path))
+    journal.add_book("Dune", "Frank Herbert", 1965, "Science Fiction", True, 5)
+    journal.add_book("Emma", "Jane Austen", 1815, "Classic", False)
+    if snapshot:
+        journal.save_library()
+    books = journal.get_all_books()
+    journal.close()
+    assert os.path.exists(tmp_path / 'books' / 'library.json') == snapshot
+
+    sqlite = create_library_manager('sqlite', library_id='books', root=str(tmp_path))
+    try:
+        assert sqlite.get_all_books() == books
+    finally:
+        sqlite.close()
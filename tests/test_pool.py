@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+import library_cli
+from library_core import LibraryPool
+
+
+def add_books(pool, library_id, counts):
+    pool.get(library_id).add_books([{'title': f"{author} {i}", 'author': author, 'genre': "Fiction", 'year': 2000}
+                                    for author, count in counts.items() for i in range(count)])
+
+
+@pytest.fixture(params=['journal', 'sqlite'])
+def pool(request, tmp_path, monkeypatch):
+    monkeypatch.setenv('LIBRARY_DURABILITY', 'best-effort')
+    pool = LibraryPool(root=str(tmp_path), backend=request.param, flush_interval=0)
+    yield pool
+    pool.close()
+
+
+def test_aggregate_author_counts_are_exact(pool):
+    # X is outside library a's top 50 but first overall
+    add_books(pool, 'a', {**{f"Author {i}": 10 for i in range(60)}, 'X': 5})
+    add_books(pool, 'b', {'X': 20})
+
+    open_stats = pool.aggregate_statistics(top_authors=3)
+    assert open_stats['top_authors'] == {'X': 25, 'Author 0': 10, 'Author 1': 10}
+    assert open_stats['total_books'] == 625
+
+    pool.close()
+    closed_stats = pool.aggregate_statistics(top_authors=3)
+    # Answered from the saved summaries, without opening either library
+    assert not pool._managers
+    assert closed_stats == open_stats
+
+
+def test_cli_libraries_saves_summaries(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('LIBRARY_DURABILITY', 'best-effort')
+    monkeypatch.setenv('LIBRARY_ROOT', str(tmp_path))
+    for library_id, title in (('a', "Dune"), ('b', "Emma")):
+        assert library_cli.main(['--library', library_id, 'add', title, "Someone", '--year', '2000']) == 0
+
+    assert library_cli.main(['--json', 'libraries']) == 0
+    assert json.loads(capsys.readouterr().out.splitlines()[-1])['libraries'] == {'a': 1, 'b': 1}
+    assert (tmp_path / 'a' / 'summary.json').exists() and (tmp_path / 'b' / 'summary.json').exists()
@@ -0,0 +1,22 @@
+from library_core import FacetIndex
+
+
+def test_batch_add_matches_one_at_a_time(tmp_path, open_manager, make_books):
+    first, batch = make_books(50, 1), make_books(FacetIndex.SORT_BATCH + 100, 2)
+    batched = open_manager(str(tmp_path / 'batched.json'))
+    single = open_manager(str(tmp_path / 'single.json'))
+    batched.add_books(first)
+    batched.add_books(batch)
+    for book in first + batch:
+        single.add_book(**book)
+
+    for entries in batched.facet_index._sorted.values():
+        assert entries == sorted(entries)
+    for filters in ({}, {'year_min': 1950, 'year_max': 1980}, {'genres': ["Poetry"], 'read': True},
+                    {'added_from': "2024-03-01", 'added_to': "2024-06-30", 'min_rating': 3}):
+        expected = single.query(page_size=1000, sort_by='year', **filters)
+        result = batched.query(page_size=1000, sort_by='year', **filters)
+        assert result['total'] == expected['total']
+        assert result['facets'] == expected['facets']
+        assert result['year_range'] == expected['year_range']
+        assert [book['title'] for book in result['books']] == [book['title'] for book in expected['books']]
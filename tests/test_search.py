@@ -0,0 +1,57 @@
+import pytest
+
+
+@pytest.fixture(params=['journal', 'sqlite'])
+def manager(request, tmp_path, open_manager):
+    manager = open_manager(str(tmp_path / ('library.db' if request.param == 'sqlite' else 'library.json')),
+                           request.param)
+    manager.add_books([
+        {'title': "Dune", 'author': "Frank Herbert", 'year': 1965, 'genre': "Science Fiction"},
+        {'title': "The Hobbit", 'author': "J.R.R. Tolkien", 'year': 1937, 'genre': "Fantasy"},
+        {'title': "Emma", 'author': "Jane Austen", 'year': 1815, 'genre': "Fiction"},
+    ])
+    yield manager
+    manager.close()
+
+
+def top_title(manager, query):
+    books = manager.search_ranked(query)
+    return books[0]['title'] if books else None
+
+
+@pytest.mark.parametrize('query, title', [("dune", "Dune"), ("dnue", "Dune"), ("hebrert", "Dune"),
+                                          ("tolkein", "The Hobbit"), ("hobit", "The Hobbit"),
+                                          ("austen", "Emma")])
+def test_ranked_search_tolerates_typos(manager, query, title):
+    assert top_title(manager, query) == title
+
+
+def test_ranked_search_follows_writes(manager):
+    assert top_title(manager, "dnue") == "Dune"
+    dune = manager.search_ranked("dune")[0]['id']
+    manager.remove_book_by_id(dune)
+    assert top_title(manager, "dnue") is None
+    messiah = manager.add_book("Dune Messiah", "Frank Herbert", 1969, "Science Fiction", False)
+    assert top_title(manager, "dnue") == "Dune Messiah"
+    manager.update_book(messiah, title="Children of Dune")
+    assert top_title(manager, "chidlren") == "Children of Dune"
+    manager.add_books([{'title': "Persuasion", 'author': "Jane Austen", 'year': 1817}])
+    assert top_title(manager, "persuasoin") == "Persuasion"
+
+
+def test_sqlite_keeps_one_search_index(tmp_path, open_manager):
+    path = str(tmp_path / 'library.db')
+    manager = open_manager(path, 'sqlite')
+    manager.search_ranked("dune")
+    index = manager.search_index
+    for number in range(40):
+        manager.add_book(f"Book {number}", "Author", 2000, "Other", False)
+        assert manager.search_ranked(f"Book {number}")[0]['title'] == f"Book {number}"
+    assert manager.search_index is index and len(index) == 40
+
+    # A commit from another connection means the index is rebuilt
+    other = open_manager(path, 'sqlite')
+    other.add_book("Dune", "Frank Herbert", 1965, "Science Fiction", False)
+    assert manager.refresh()
+    assert top_title(manager, "dnue") == "Dune"
+    assert len(manager.search_index) == 41
@@ -0,0 +1,16 @@
+from library_core import TopCounter
+
+
+def test_top_counter_breaks_ties_by_who_reached_the_count_first():
+    counter = TopCounter()
+    for author in "ABBA":
+        counter.increment(author)
+    # B got to 2 first
+    assert counter.most_common(2) == [('B', 2), ('A', 2)]
+    counter.increment('C')
+    counter.decrement('B')
+    assert counter.most_common(3) == [('A', 2), ('C', 1), ('B', 1)]
+    counter.decrement('A')
+    counter.decrement('A')
+    assert counter.most_common(5) == [('C', 1), ('B', 1)]
+    assert counter.counts == {'B': 1, 'C': 1}
@@ -0,0 +1,105 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from library_core import JSONStorage, JournalStorage, LibraryManager
+
+STORAGES = {'journal': JournalStorage, 'json': JSONStorage}
+
+
+def titles(manager):
+    return sorted(book['title'] for book in manager.get_all_books())
+
+
+@pytest.mark.parametrize('backend', list(STORAGES))
+def test_changes_from_another_process_are_merged(tmp_path, backend, open_manager):
+    # Two managers on the same files stand in for two processes
+    path = str(tmp_path / 'library.json')
+    first = open_manager(path, backend)
+    second = open_manager(path, backend)
+    first.add_book("Dune", "Frank Herbert", 1965, "Science Fiction", False)
+    assert second.refresh()
+    assert not second.refresh()
+    assert titles(second) == ["Dune"]
+
+    # A write merges first, so neither side overwrites the other
+    second.add_book("Emma", "Jane Austen", 1815, "Fiction", False)
+    first.add_book("Persuasion", "Jane Austen", 1817, "Fiction", False)
+    assert titles(first) == ["Dune", "Emma", "Persuasion"]
+    second.refresh()
+    assert titles(second) == titles(first) == titles(open_manager(path, backend))
+    # Ids are never handed out twice
+    assert len({book['id'] for book in first.get_all_books()}) == 3
+
+
+def test_refresh_while_another_thread_writes(tmp_path, open_manager):
+    # The background writer holds the file lock from its own thread while
+    # refresh() checks for changes from the others
+    path = str(tmp_path / 'library.json')
+    manager = open_manager(path, flush_interval=0.01)
+    deadline = time.monotonic() + 1
+    errors = []
+
+    def run(action):
+        try:
+            while time.monotonic() < deadline:
+                action()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(lambda: manager.add_book("Dune", "Frank Herbert", 1965,
+                                                                            "Science Fiction", False),))]
+    threads += [threading.Thread(target=run, args=(manager.refresh,)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    manager.close()
+    assert len(open_manager(path).get_all_books()) == len(manager.get_all_books())
+
+
+@pytest.mark.parametrize('backend', list(STORAGES))
+def test_background_writer_keeps_other_processes_writes(tmp_path, backend, open_manager):
+    # Handing out an id takes the file lock without merging; that must not
+    # count as having seen the other process's book
+    path = str(tmp_path / 'library.json')
+    batched = open_manager(path, backend, flush_interval=0.05)
+    direct = open_manager(path, backend)
+    direct.add_book("from-b", "B", 2000, "Other", False)
+    batched.add_book("from-a", "A", 2000, "Other", False)
+    batched.flush()
+    assert titles(open_manager(path, backend)) == ["from-a", "from-b"]
+    assert titles(batched) == ["from-a", "from-b"]
+    batched.close()
+
+
+def _add_and_remove(path, backend, flush_interval, name, count, start):
+    # Runs in a fresh process, where there are no fixtures
+    manager = LibraryManager(STORAGES[backend](path, fsync=False), flush_interval)
+    start.wait()
+    for number in range(count):
+        book_id = manager.add_book(f"{name} {number}", name, 2000, "Other", False)
+        if number % 5 == 0:
+            manager.remove_book_by_id(book_id)
+    manager.close()
+
+
+@pytest.mark.parametrize('backend', list(STORAGES))
+def test_concurrent_processes_lose_nothing(tmp_path, backend, open_manager):
+    path = str(tmp_path / 'library.json')
+    context = multiprocessing.get_context('spawn')
+    start = context.Barrier(4)
+    workers = [context.Process(target=_add_and_remove,
+                               args=(path, backend, interval, f"worker{number}", 200, start))
+               for number, interval in enumerate([0.01, 0.01, 0.01, 0])]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(worker.exitcode == 0 for worker in workers)
+    books = open_manager(path, backend).get_all_books()
+    assert len(books) == 4 * 160
+    assert len({book['id'] for book in books}) == len(books)